@@ -2,13 +2,17 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import BasePermission, DjangoModelPermissions
 from django.core.exceptions import PermissionDenied
 
+from case_management.cache import token_cache
 from case_management.enums import PermissionGroups
-from case_management.models import CaseOffice
+from case_management.models import CaseOffice, Client, LegalCase, LoggedChildModel
 
 
 class BearerTokenAuthentication(TokenAuthentication):
     keyword = 'Bearer'
 
+    def authenticate_credentials(self, key):
+        return token_cache.get_or_authenticate(key, super().authenticate_credentials)
+
 """
 TODO: Remove unnecessary has_object_permission implementations once issue fixed
 (the ones simply returning `self.has_permission(request, view)`)
@@ -51,14 +55,71 @@ class InCaseWorkerGroup(BasePermission):
 
 
 def has_object_permission(request, view, obj):
-    permitted = False
-    if view.basename == 'caseoffice':
-        permitted = request.user.case_office.id == obj.id
-    elif hasattr(obj, 'case_office'):
-        permitted = request.user.case_office == obj.case_office
-    elif hasattr(obj, 'case_offices'):
-        permitted = request.user.case_office in obj.case_offices.all()
-    return permitted
+    return get_case_office_scope(request).includes_object(obj)
+
+
+class CaseOfficeScope:
+    """
+    What a user reaches through their case office. Lookups are memoized, one
+    scope is shared by all permission checks of a request.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.case_office_id = user.case_office_id
+        self._legal_cases = {}
+        self._clients = {}
+        self._objects = {}
+
+    def includes_case_office(self, case_office_id):
+        return self.case_office_id is not None and self.case_office_id == case_office_id
+
+    def includes_legal_case(self, legal_case_id):
+        if legal_case_id not in self._legal_cases:
+            self._legal_cases[legal_case_id] = (
+                self.case_office_id is not None
+                and LegalCase.case_offices.through.objects.filter(
+                    legalcase_id=legal_case_id, caseoffice_id=self.case_office_id
+                ).exists()
+            )
+        return self._legal_cases[legal_case_id]
+
+    def includes_client(self, client_id):
+        if client_id not in self._clients:
+            self._clients[client_id] = (
+                self.case_office_id is not None
+                and LegalCase.case_offices.through.objects.filter(
+                    legalcase__client_id=client_id, caseoffice_id=self.case_office_id
+                ).exists()
+            )
+        return self._clients[client_id]
+
+    def includes_object(self, obj):
+        key = (obj._meta.label, obj.pk)
+        if key not in self._objects:
+            self._objects[key] = self._includes_object(obj)
+        return self._objects[key]
+
+    def _includes_object(self, obj):
+        if isinstance(obj, CaseOffice):
+            return self.includes_case_office(obj.id)
+        if isinstance(obj, LegalCase):
+            return self.includes_legal_case(obj.id)
+        if isinstance(obj, Client):
+            return self.includes_client(obj.id)
+        if isinstance(obj, LoggedChildModel):
+            return obj.legal_case_id is not None and self.includes_legal_case(obj.legal_case_id)
+        if hasattr(obj, 'case_office_id'):
+            return self.includes_case_office(obj.case_office_id)
+        return False
+
+
+def get_case_office_scope(request):
+    scope = getattr(request, '_case_office_scope', None)
+    if scope is None or scope.user != request.user:
+        scope = CaseOfficeScope(request.user)
+        request._case_office_scope = scope
+    return scope
 
 
 def permission_is_scoped(permission_group):
@@ -73,15 +134,14 @@ def check_create_update_permission(request):
     if not request.user.is_authenticated:
         raise PermissionDenied
     if permission_is_scoped(request.user.permission_group):
+        scope = get_case_office_scope(request)
         permitted = False
         if 'case_office' in request.data:
-            permitted = request.user.case_office.id == request.data['case_office']
+            permitted = scope.includes_case_office(request.data['case_office'])
         elif 'case_offices' in request.data:
-            permitted = len(request.data['case_offices']) == 1 and request.user.case_office.id == request.data['case_offices'][0]
+            permitted = len(request.data['case_offices']) == 1 and scope.includes_case_office(request.data['case_offices'][0])
         elif 'legal_case' in request.data:
-            legal_case_id = request.data['legal_case']
-            user_case_office_match = CaseOffice.objects.filter(legalcase__id=legal_case_id, id=request.user.case_office.id)
-            permitted = bool(user_case_office_match)
+            permitted = scope.includes_legal_case(request.data['legal_case'])
         if not permitted:
             raise PermissionDenied
 
@@ -91,7 +151,7 @@ def check_scoped_list_permission(request, view):
         raise PermissionDenied
     if permission_is_scoped(request.user.permission_group) and not view_allows_listing_without_filter(view):
         scope_filter = request.query_params.get(view.permission_scope_query_param)
-        if scope_filter is None or int(scope_filter) not in view.permission_scope_query_param_values:
+        if scope_filter is None or not view.permission_scope_includes(int(scope_filter)):
             raise PermissionDenied
 
 
@@ -100,5 +160,5 @@ def check_scoped_reporting_permision(request):
         raise PermissionDenied
     if permission_is_scoped(request.user.permission_group):
         case_office_filter = request.query_params.get('caseOffice')
-        if case_office_filter is None or request.user.case_office.id != int(case_office_filter):
+        if case_office_filter is None or not get_case_office_scope(request).includes_case_office(int(case_office_filter)):
             raise PermissionDenied
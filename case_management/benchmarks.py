@@ -0,0 +1,384 @@
+"""
+Query count and latency benchmarks of the REST API, on synthetic data.
+
+Not part of the tests, run them with
+
+    python manage.py test case_management.benchmarks
+
+Every route is requested BENCHMARK_REPEAT times on a dataset of
+BENCHMARK_SCALE (see case_management.synthetic.Scale, e.g.
+`offices=5,clients=2000`) generated from BENCHMARK_SEED. A route fails when it
+takes more queries than its budget in QUERY_BUDGETS, or when its p95 latency is
+over BENCHMARK_P95_MS.
+
+With BENCHMARK_BASELINE set to the results of an earlier run on the same scale
+and seed, routes also fail when they take more queries than then, or when
+their p95 latency is over BENCHMARK_TOLERANCE times that of then plus
+BENCHMARK_SLACK_MS, for the noise of short requests. Results are written to
+BENCHMARK_RESULTS as JSON.
+"""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from case_management.cache import report_cache
+from case_management.models import (
+    CaseOffice,
+    CaseType,
+    CaseUpdate,
+    Client,
+    File,
+    LegalCase,
+    Log,
+    Meeting,
+    Note,
+    User,
+)
+from case_management.synthetic import Scale, SyntheticData
+
+SCALE = Scale.parse(os.environ.get('BENCHMARK_SCALE', ''))
+SEED = int(os.environ.get('BENCHMARK_SEED', 0))
+REPEAT = int(os.environ.get('BENCHMARK_REPEAT', 10))
+P95_MS = float(os.environ.get('BENCHMARK_P95_MS', 1000))
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', 1.5))
+SLACK_MS = float(os.environ.get('BENCHMARK_SLACK_MS', 25))
+BASELINE = os.environ.get('BENCHMARK_BASELINE')
+RESULTS = os.environ.get('BENCHMARK_RESULTS')
+
+# Most queries a request of the route may take, whatever the scale
+QUERY_BUDGETS = {
+    'cases.list': 8,
+    'cases.list.not-modified': 4,
+    'cases.retrieve': 8,
+    'cases.retrieve.not-modified': 4,
+    'cases.create': 26,
+    'cases.update': 16,
+    'clients.list': 7,
+    'clients.list.not-modified': 4,
+    'clients.retrieve': 9,
+    'clients.retrieve.not-modified': 4,
+    'clients.create': 18,
+    'clients.update': 15,
+    'case-offices.list': 4,
+    'case-offices.list.not-modified': 4,
+    'case-offices.retrieve': 4,
+    'case-offices.retrieve.not-modified': 4,
+    'case-offices.create': 8,
+    'case-offices.update': 8,
+    'case-types.list': 4,
+    'case-types.list.not-modified': 4,
+    'case-types.retrieve': 4,
+    'case-types.retrieve.not-modified': 4,
+    'case-types.create': 8,
+    'case-types.update': 8,
+    'case-updates.list': 11,
+    'case-updates.list.not-modified': 4,
+    'case-updates.retrieve': 11,
+    'case-updates.retrieve.not-modified': 4,
+    'case-updates.create': 17,
+    'case-updates.update': 20,
+    'files.list': 4,
+    'files.list.not-modified': 4,
+    'files.retrieve': 4,
+    'files.retrieve.not-modified': 4,
+    'files.create': 8,
+    'files.update': 9,
+    'meetings.list': 6,
+    'meetings.list.not-modified': 4,
+    'meetings.retrieve': 6,
+    'meetings.retrieve.not-modified': 4,
+    'meetings.create': 9,
+    'meetings.update': 12,
+    'notes.list': 6,
+    'notes.list.not-modified': 4,
+    'notes.retrieve': 6,
+    'notes.retrieve.not-modified': 4,
+    'notes.create': 9,
+    'notes.update': 12,
+    'users.list': 3,
+    'users.retrieve': 3,
+    'users.update': 5,
+    'logs.list': 4,
+    'logs.retrieve': 5,
+    'reports.range-summary': 3,
+    'reports.monthly-summary': 3,
+    'reports.daily-summary': 3,
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+class BenchmarkTestCase(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        if RESULTS:
+            with open(RESULTS, 'w') as results:
+                json.dump(
+                    {
+                        'scale': SCALE.as_dict(),
+                        'seed': SEED,
+                        'repeat': REPEAT,
+                        'routes': dict(sorted(cls.results.items())),
+                    },
+                    results,
+                    indent=2,
+                )
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticData(SCALE, SEED).write()
+        cls.user = User.objects.create_user(
+            'benchmark@test.test', 'password', permission_group='Admin'
+        )
+        cls.case_office = CaseOffice.objects.order_by('id').first()
+        cls.legal_case = LegalCase.objects.filter(case_offices=cls.case_office).first()
+        cls.file = File.objects.create(
+            legal_case=cls.legal_case,
+            upload=SimpleUploadedFile('benchmark.txt', b'Benchmark'),
+        )
+        cls.baseline = {}
+        if BASELINE:
+            with open(BASELINE) as baseline:
+                baseline = json.load(baseline)
+            if (baseline['scale'], baseline['seed']) != (SCALE.as_dict(), SEED):
+                raise ValueError(
+                    f'{BASELINE} was measured on other data, scale '
+                    f"{Scale(**baseline['scale'])} and seed {baseline['seed']}"
+                )
+            cls.baseline = baseline['routes']
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.case_office_id = self.case_office.id
+
+    def measure(
+        self, route, method, url, data=None, format='json', status=200, **headers
+    ):
+        """
+        Request the route REPEAT times, data(i) gives the data of the ith
+        request, and check the query count and latency.
+        """
+        if method == 'get':
+            # Leave first request costs, e.g. of content types, out
+            getattr(self.api, method)(url, data)
+        queries = []
+        milliseconds = []
+        for i in range(REPEAT):
+            if route.startswith('reports.'):
+                # Time the report queries, not the cache
+                report_cache.cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(self.api, method)(
+                    url, data(i) if callable(data) else data, format=format, **headers
+                )
+                milliseconds.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(
+                response.status_code, status, f'{route}: {response.content[:500]}'
+            )
+            queries.append(len(captured))
+        result = {
+            'queries': max(queries),
+            'p50_ms': round(percentile(milliseconds, 50), 2),
+            'p95_ms': round(percentile(milliseconds, 95), 2),
+            'max_ms': round(max(milliseconds), 2),
+        }
+        self.results[route] = result
+
+        with self.subTest(route=route):
+            self.assertLessEqual(
+                result['queries'], QUERY_BUDGETS[route], 'queries over budget'
+            )
+            self.assertLessEqual(result['p95_ms'], P95_MS, 'p95 latency over threshold')
+            baseline = self.baseline.get(route)
+            if baseline:
+                self.assertLessEqual(
+                    result['queries'],
+                    baseline['queries'],
+                    'more queries than the baseline',
+                )
+                self.assertLessEqual(
+                    result['p95_ms'],
+                    baseline['p95_ms'] * TOLERANCE + SLACK_MS,
+                    'p95 latency regressed',
+                )
+
+    def measure_routes(
+        self, name, instance, create=None, update=None, status=201, format='json'
+    ):
+        for action, url in (
+            ('list', f'/api/v1/{name}/'),
+            ('retrieve', f'/api/v1/{name}/{instance.id}/'),
+        ):
+            self.measure(f'{name}.{action}', 'get', url)
+            # Revalidating what was sent before
+            etag = self.api.get(url)['ETag']
+            self.measure(
+                f'{name}.{action}.not-modified',
+                'get',
+                url,
+                status=304,
+                HTTP_IF_NONE_MATCH=etag,
+            )
+        if create is not None:
+            self.measure(
+                f'{name}.create', 'post', f'/api/v1/{name}/', create, format, status
+            )
+        if update is not None:
+            self.measure(
+                f'{name}.update',
+                'patch',
+                f'/api/v1/{name}/{instance.id}/',
+                update,
+                format,
+            )
+
+    def test_cases(self):
+        client = Client.objects.first()
+        self.measure_routes(
+            'cases',
+            self.legal_case,
+            create=lambda i: {
+                'client': client.id,
+                'case_offices': [self.case_office_id],
+                'users': [self.user.id],
+                'summary': f'Benchmark case {i}',
+            },
+            update=lambda i: {'summary': f'Updated {i}'},
+        )
+
+    def test_clients(self):
+        self.measure_routes(
+            'clients',
+            self.legal_case.client,
+            create=lambda i: {
+                'name': f'Benchmark Client {i}',
+                'official_identifier': f'benchmark-{i}',
+                'official_identifier_type': 'National',
+                'users': [self.user.id],
+            },
+            update=lambda i: {'preferred_name': f'Client {i}'},
+        )
+
+    def test_case_offices(self):
+        self.measure_routes(
+            'case-offices',
+            self.case_office,
+            create=lambda i: {
+                'name': f'Benchmark Office {i}',
+                'description': 'Benchmark',
+            },
+            update=lambda i: {'description': f'Updated {i}'},
+        )
+
+    def test_case_types(self):
+        self.measure_routes(
+            'case-types',
+            CaseType.objects.first(),
+            create=lambda i: {
+                'title': f'Benchmark Type {i}',
+                'description': 'Benchmark',
+            },
+            update=lambda i: {'description': f'Updated {i}'},
+        )
+
+    def test_case_updates(self):
+        self.measure_routes(
+            'case-updates',
+            CaseUpdate.objects.filter(legal_case=self.legal_case).first(),
+            create=lambda i: {
+                'legal_case': self.legal_case.id,
+                'note': {'title': f'Note {i}', 'content': 'Benchmark'},
+            },
+            update=lambda i: {'files': [self.file.id]},
+        )
+
+    def test_files(self):
+        self.measure_routes(
+            'files',
+            self.file,
+            create=lambda i: {
+                'legal_case': self.legal_case.id,
+                'upload': SimpleUploadedFile(f'benchmark{i}.txt', b'Benchmark'),
+            },
+            update=lambda i: {'description': f'Updated {i}'},
+            format='multipart',
+        )
+
+    def test_meetings(self):
+        meeting = (
+            Meeting.objects.filter(legal_case=self.legal_case).first()
+            or Meeting.objects.first()
+        )
+        self.measure_routes(
+            'meetings',
+            meeting,
+            create=lambda i: {
+                'legal_case': self.legal_case.id,
+                'meeting_date': '2022-09-21T10:00:00Z',
+                'location': 'Office',
+                'notes': f'Meeting {i}',
+            },
+            update=lambda i: {'notes': f'Updated {i}'},
+        )
+
+    def test_notes(self):
+        self.measure_routes(
+            'notes',
+            Note.objects.first(),
+            create=lambda i: {
+                'legal_case': self.legal_case.id,
+                'title': f'Note {i}',
+                'content': 'Benchmark',
+            },
+            update=lambda i: {'content': f'Updated {i}'},
+        )
+
+    def test_users(self):
+        user = User.objects.exclude(id=self.user.id).first()
+        self.measure('users.list', 'get', '/api/v1/users/')
+        self.measure('users.retrieve', 'get', f'/api/v1/users/{user.id}/')
+        self.measure(
+            'users.update',
+            'patch',
+            f'/api/v1/users/{user.id}/',
+            lambda i: {'name': f'User {i}'},
+        )
+
+    def test_logs(self):
+        self.measure(
+            'logs.list',
+            'get',
+            f'/api/v1/logs/?parent_type=LegalCase&parent_id={self.legal_case.id}',
+        )
+        self.measure('logs.retrieve', 'get', f'/api/v1/logs/{Log.objects.first().id}/')
+
+    def test_reports(self):
+        for report in ('range-summary', 'monthly-summary', 'daily-summary'):
+            self.measure(f'reports.{report}', 'get', f'/api/v1/reports/{report}')
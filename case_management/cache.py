@@ -0,0 +1,176 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.db import transaction
+
+
+class CacheCounters:
+    """
+    Hit and miss counts kept in the cache backend, so that with a shared
+    backend they cover all processes.
+    """
+
+    prefix = None
+
+    def _counter_key(self, name):
+        return f'{self.prefix}:stats:{name}'
+
+    def _count(self, name):
+        key = self._counter_key(name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Missing, or culled, counters start over
+            if not self.cache.add(key, 1, timeout=None):
+                self.cache.incr(key)
+
+    def _counts(self):
+        keys = {name: self._counter_key(name) for name in ('hits', 'misses')}
+        values = self.cache.get_many(keys.values())
+        return {name: values.get(key, 0) for name, key in keys.items()}
+
+    @property
+    def hits(self):
+        return self._counts()['hits']
+
+    @property
+    def misses(self):
+        return self._counts()['misses']
+
+
+class ReportCache(CacheCounters):
+    """
+    Cache of report results keyed on report, date range and case office.
+
+    Every case office has a generation that is part of the key of its cached
+    results. Invalidating an office moves it to a new generation, so its old
+    results are never read again and age out of the cache (TTL and LRU culling
+    are configured on the cache backend).
+    """
+
+    ALL_CASE_OFFICES = 'all'
+    MISSING = object()
+    prefix = 'reports'
+
+    def __init__(self, alias='reports'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _scope(self, case_office):
+        return self.ALL_CASE_OFFICES if case_office is None else int(case_office)
+
+    def _generation_key(self, scope):
+        return f'reports:generation:{scope}'
+
+    def _new_generation(self):
+        # Never reuse a generation if the key was culled from the cache
+        return time.time_ns()
+
+    def _generation(self, scope):
+        return self.cache.get_or_set(
+            self._generation_key(scope), self._new_generation, timeout=None
+        )
+
+    def get_or_compute(self, report, start, end, case_office, compute):
+        scope = self._scope(case_office)
+        key = f'reports:{report}:{start}:{end}:{scope}:{self._generation(scope)}'
+        result = self.cache.get(key, self.MISSING)
+        if result is not self.MISSING:
+            self._count('hits')
+            return result
+        self._count('misses')
+        result = compute()
+        self.cache.set(key, result)
+        return result
+
+    def invalidate(self, case_office_ids):
+        """
+        Invalidate cached reports of the case offices, and of all offices
+        combined, once the current transaction commits.
+        """
+        scopes = {self._scope(case_office_id) for case_office_id in case_office_ids}
+        if not scopes:
+            return
+        scopes.add(self.ALL_CASE_OFFICES)
+        transaction.on_commit(lambda: self._bump(scopes))
+
+    def _bump(self, scopes):
+        self.cache.set_many(
+            {self._generation_key(scope): self._new_generation() for scope in scopes},
+            timeout=None,
+        )
+
+    def stats(self):
+        return self._counts()
+
+
+class TokenCache(CacheCounters):
+    """
+    Cache of authenticated (user, token) pairs keyed on a hash of the token key,
+    so API calls with a known token skip the Token and User lookups.
+
+    Entries expire after the cache backend's TTL and are deleted once a token
+    is deleted or its user is saved, e.g. deactivated or moved to another
+    permission group or case office. Nothing is cached with the default dummy
+    backend, as deleting entries from a per process cache would not revoke
+    tokens in the other processes.
+    """
+
+    prefix = 'tokens'
+
+    def __init__(self, alias='tokens'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return not isinstance(self.cache, DummyCache)
+
+    def _key(self, token_key):
+        return 'tokens:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+    def get_or_authenticate(self, token_key, authenticate):
+        if not self.enabled:
+            return authenticate(token_key)
+        key = self._key(token_key)
+        credentials = self.cache.get(key)
+        if credentials is not None:
+            self._count('hits')
+            return credentials
+        self._count('misses')
+        # Failed authentication raises and is never cached
+        credentials = authenticate(token_key)
+        self.cache.set(key, credentials)
+        return credentials
+
+    def invalidate(self, token_keys):
+        """
+        Drop cached credentials of the tokens now and again once the current
+        transaction commits, so a request running in between can't cache the
+        old user for the whole TTL.
+        """
+        keys = [self._key(token_key) for token_key in token_keys]
+        if not keys:
+            return
+        self.cache.delete_many(keys)
+        transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+    def stats(self):
+        counts = self._counts()
+        lookups = counts['hits'] + counts['misses']
+        return {
+            **counts,
+            'hit_rate': counts['hits'] / lookups if lookups else None,
+        }
+
+
+report_cache = ReportCache()
+token_cache = TokenCache()
@@ -13,6 +13,12 @@ class LogChangeTypes(models.TextChoices):
     REMOVE = 'Remove'
 
 
+class DailyMetrics(models.TextChoices):
+    CASES_OPENED = 'CasesOpened', 'Cases opened'
+    CASES_CLOSED = 'CasesClosed', 'Cases closed'
+    CASES_WITH_ACTIVITY = 'CasesWithActivity', 'Cases with activity'
+
+
 class OfficialIdentifiers(models.TextChoices):
     NATIONAL_ID = 'National', 'National Identity Number'
     PASSPORT_NUMBER = 'Passport', 'Passport Number'
@@ -0,0 +1,178 @@
+import csv
+import datetime
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.db.models import Subquery
+
+from case_management.models import Client, LegalCase, Log
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Rows fetched from the database cursor at a time
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _legal_cases(case_office_id):
+    legal_cases = LegalCase.objects.all()
+    if case_office_id is not None:
+        legal_cases = legal_cases.filter(case_offices=case_office_id)
+    return legal_cases
+
+
+def _clients(case_office_id):
+    clients = Client.objects.all()
+    if case_office_id is not None:
+        clients = clients.filter(legal_cases__case_offices=case_office_id).distinct()
+    return clients
+
+
+def _logs(case_office_id):
+    logs = Log.objects.all()
+    if case_office_id is not None:
+        logs = logs.filter(
+            parent_type='LegalCase',
+            parent_id__in=Subquery(_legal_cases(case_office_id).values('id')),
+        )
+    return logs
+
+
+EXPORTS = {
+    'cases': _legal_cases,
+    'clients': _clients,
+    'logs': _logs,
+}
+
+
+def export_rows(name, case_office_id=None):
+    """
+    Header and rows of all concrete fields of an export, optionally only of a
+    case office. Rows are streamed from a server side cursor.
+    """
+    queryset = EXPORTS[name](case_office_id)
+    columns = [field.attname for field in queryset.model._meta.concrete_fields]
+    rows = (
+        queryset.order_by('id')
+        .values_list(*columns)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return columns, rows
+
+
+class _Buffer:
+    '''Write-only file whose contents are taken after every write'''
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(
+            chunk.encode() if isinstance(chunk, str) else chunk for chunk in self.data
+        )
+        self.data = []
+        return data
+
+
+def _csv_value(value):
+    return '' if value is None else value
+
+
+def stream_csv(columns, rows):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.take()
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        yield buffer.take()
+
+
+XLSX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+XLSX_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+XLSX_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+XLSX_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+XLSX_SHEET_START = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'''
+
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# Control characters are not allowed in XML documents
+XML_ILLEGAL_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    text = escape(XML_ILLEGAL_CHARACTERS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(columns, rows, sheet_name='Export'):
+    """
+    A single sheet XLSX workbook with inline strings. The zip file is written
+    to a buffer that is emptied as it goes, so only the current row is kept in
+    memory.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        workbook.writestr('_rels/.rels', XLSX_RELS)
+        workbook.writestr(
+            'xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name))
+        )
+        workbook.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield buffer.take()
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(XLSX_SHEET_START.encode())
+            sheet.write(_xlsx_row(columns).encode())
+            for row in rows:
+                sheet.write(_xlsx_row(row).encode())
+                yield buffer.take()
+            sheet.write(XLSX_SHEET_END.encode())
+    yield buffer.take()
+
+
+def stream_export(columns, rows, export_format, sheet_name='Export'):
+    if export_format == 'csv':
+        return stream_csv(columns, rows)
+    return stream_xlsx(columns, rows, sheet_name)
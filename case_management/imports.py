@@ -0,0 +1,274 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueTogetherValidator
+
+from case_management.cache import report_cache
+from case_management.enums import DailyMetrics, LogChangeTypes
+from case_management.models import (
+    CaseNumberSequence,
+    CaseOfficeDailyMetric,
+    Client,
+    LegalCase,
+    LegalCaseLifecycle,
+    bulkLogIt,
+    metricDay,
+)
+from case_management.serializers import ClientSerializer, LegalCaseSerializer
+
+# Columns with this prefix are legal case fields, all others client fields
+CASE_FIELD_PREFIX = 'case_'
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+UNIQUE_CLIENT_ERROR = (
+    'The fields official_identifier, official_identifier_type must make a unique set.'
+)
+
+
+def import_format(file_name):
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(
+            f'Unknown import format {extension}, use one of {IMPORT_FORMATS}'
+        )
+    return extension
+
+
+def read_rows(file, file_format):
+    """
+    Yield the rows of a text file as dicts, lazily so large files are never
+    loaded at once. Empty CSV cells are left out, so they get the defaults of
+    their fields.
+    """
+    if file_format == 'csv':
+        for row in csv.DictReader(file):
+            yield {key: value for key, value in row.items() if value != ''}
+    elif file_format == 'jsonl':
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(
+            f'Unknown import format {file_format}, use one of {IMPORT_FORMATS}'
+        )
+
+
+def official_identifier(client_data):
+    """
+    The official identifier and its type, unique among clients, or None if
+    either is missing
+    """
+    identifier = (
+        client_data.get('official_identifier'),
+        client_data.get('official_identifier_type'),
+    )
+    return None if None in identifier else identifier
+
+
+def read_uploaded_rows(uploaded_file, file_format=None):
+    if file_format is None:
+        file_format = import_format(uploaded_file.name)
+    return read_rows(io.TextIOWrapper(uploaded_file, encoding='utf-8'), file_format)
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.seconds = 0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else None
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+class CaseImporter:
+    """
+    Create a client and a legal case in the case office for every row.
+
+    Rows are validated with the API serializers and written in chunks with
+    bulk_create, so hooks are bypassed and their work (case numbers, audit
+    logs, lifecycles, daily metrics, report invalidation) is done once per
+    chunk. Invalid rows are reported and skipped, every chunk is committed on
+    its own unless the importer runs in a transaction.
+    """
+
+    def __init__(self, case_office, user=None, chunk_size=500):
+        self.case_office = case_office
+        self.user = user
+        self.chunk_size = chunk_size
+        self.client_serializer = ClientSerializer(context={'include_updates': False})
+        self.client_serializer.fields.pop('users')
+        # Checked for the whole chunk at once in import_chunk
+        self.client_serializer.validators = [
+            validator
+            for validator in self.client_serializer.validators
+            if not isinstance(validator, UniqueTogetherValidator)
+        ]
+        self.case_serializer = LegalCaseSerializer()
+        for field in ('client', 'case_number', 'case_offices', 'users'):
+            self.case_serializer.fields.pop(field)
+        self.official_identifiers = set()
+
+    def run(self, rows):
+        result = ImportResult()
+        started = time.monotonic()
+        rows = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            result.rows += len(chunk)
+            result.created += self.import_chunk(chunk, result.errors)
+        result.seconds = time.monotonic() - started
+        return result
+
+    def validate(self, row):
+        client_data = {}
+        case_data = {}
+        for key, value in row.items():
+            if key.startswith(CASE_FIELD_PREFIX):
+                case_data[key[len(CASE_FIELD_PREFIX) :]] = value
+            else:
+                client_data[key] = value
+        errors = {}
+        try:
+            client_data = self.client_serializer.run_validation(client_data)
+        except ValidationError as e:
+            errors.update(e.detail)
+        try:
+            case_data = self.case_serializer.run_validation(case_data)
+        except ValidationError as e:
+            errors.update(
+                {CASE_FIELD_PREFIX + key: value for key, value in e.detail.items()}
+            )
+        if errors:
+            raise ValidationError(errors)
+        return client_data, case_data
+
+    def import_chunk(self, chunk, errors):
+        validated = []
+        for row_number, row in chunk:
+            try:
+                validated.append((row_number, self.validate(row)))
+            except ValidationError as e:
+                errors.append({'row': row_number, 'errors': e.detail})
+
+        identifiers = [
+            official_identifier(client_data) for _, (client_data, _) in validated
+        ]
+        existing = set(
+            Client.objects.filter(
+                official_identifier__in=[
+                    identifier[0]
+                    for identifier in identifiers
+                    if identifier is not None
+                ]
+            ).values_list('official_identifier', 'official_identifier_type')
+        )
+        valid = []
+        for (row_number, (client_data, case_data)), identifier in zip(
+            validated, identifiers
+        ):
+            if identifier is not None:
+                if identifier in existing or identifier in self.official_identifiers:
+                    errors.append(
+                        {
+                            'row': row_number,
+                            'errors': {'non_field_errors': [UNIQUE_CLIENT_ERROR]},
+                        }
+                    )
+                    continue
+                self.official_identifiers.add(identifier)
+            valid.append((client_data, case_data))
+        if valid:
+            with transaction.atomic():
+                self.create(valid)
+        return len(valid)
+
+    def create(self, valid):
+        clients = []
+        for client_data, _ in valid:
+            client = Client(**client_data, created_by=self.user, updated_by=self.user)
+            if client.preferred_name == '':
+                client.preferred_name = client.name
+            clients.append(client)
+        Client.objects.bulk_create(clients)
+
+        case_numbers = CaseNumberSequence.objects.next_case_numbers(
+            self.case_office.case_office_code, len(valid)
+        )
+        legal_cases = LegalCase.objects.bulk_create(
+            [
+                LegalCase(
+                    **case_data,
+                    client=client,
+                    case_number=case_number,
+                    created_by=self.user,
+                    updated_by=self.user,
+                )
+                for (_, case_data), client, case_number in zip(
+                    valid, clients, case_numbers
+                )
+            ]
+        )
+        LegalCase.case_offices.through.objects.bulk_create(
+            [
+                LegalCase.case_offices.through(
+                    legalcase_id=legal_case.id, caseoffice_id=self.case_office.id
+                )
+                for legal_case in legal_cases
+            ]
+        )
+        LegalCaseLifecycle.objects.bulk_create(
+            [
+                LegalCaseLifecycle.for_legal_case(legal_case)
+                for legal_case in legal_cases
+            ]
+        )
+
+        bulkLogIt(clients, 'Create', user=self.user)
+        for legal_case in legal_cases:
+            legal_case._case_office_ids = [self.case_office.id]
+        case_offices_change = [
+            ('case_offices', [self.case_office.id], LogChangeTypes.ADD)
+        ]
+        bulkLogIt(
+            legal_cases,
+            'Create',
+            user=self.user,
+            extra_changes=lambda legal_case: case_offices_change,
+        )
+
+        # Through rows are written without m2m_changed, which counts openings
+        CaseOfficeDailyMetric.objects.add(
+            Counter(
+                (
+                    self.case_office.id,
+                    metricDay(legal_case.created_at),
+                    DailyMetrics.CASES_OPENED,
+                )
+                for legal_case in legal_cases
+            )
+        )
+        case_office_ids = [self.case_office.id]
+        if self.user is not None and self.user.case_office_id:
+            case_office_ids.append(self.user.case_office_id)
+        report_cache.invalidate(case_office_ids)
@@ -0,0 +1,143 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL statement text logged, statements are logged without parameters
+SQL_LOG_LENGTH = 500
+
+_current = ContextVar('request_instrumentation', default=None)
+
+
+class RequestInstrumentation:
+    """
+    Timings of a request: an execute wrapper counting and timing its SQL
+    statements, and the time its API serializers spend in to_representation.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0
+        self.slowest_sql_seconds = 0
+        self.slowest_sql = None
+        self.serializer_seconds = 0
+        self.serializing = False
+        self.response_bytes = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.queries += 1
+            self.sql_seconds += seconds
+            if seconds >= self.slowest_sql_seconds:
+                self.slowest_sql_seconds = seconds
+                self.slowest_sql = sql
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return ', '.join(
+            [
+                f'total;dur={total:.1f}',
+                f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries"',
+                f'db-slowest;dur={self.slowest_sql_seconds * 1000:.1f}',
+                f'serializer;dur={self.serializer_seconds * 1000:.1f}',
+            ]
+        )
+
+    def log(self, request, response):
+        logger.info(
+            json.dumps(
+                {
+                    'method': request.method,
+                    'path': request.path,
+                    'view': getattr(request.resolver_match, 'view_name', None),
+                    'status': response.status_code,
+                    'duration_ms': round(
+                        (time.perf_counter() - self.started) * 1000, 2
+                    ),
+                    'queries': self.queries,
+                    'sql_ms': round(self.sql_seconds * 1000, 2),
+                    'slowest_sql_ms': round(self.slowest_sql_seconds * 1000, 2),
+                    'slowest_sql': (self.slowest_sql or '')[:SQL_LOG_LENGTH] or None,
+                    'serializer_ms': round(self.serializer_seconds * 1000, 2),
+                    'response_bytes': self.response_bytes,
+                }
+            )
+        )
+
+
+@contextmanager
+def serializing():
+    """
+    Count the time spent in the block as serializer time of the sampled
+    request, if any. Nested serializers are part of the outermost one.
+    """
+    instrumentation = _current.get()
+    if instrumentation is None or instrumentation.serializing:
+        yield
+        return
+    instrumentation.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        instrumentation.serializer_seconds += time.perf_counter() - started
+        instrumentation.serializing = False
+
+
+class RequestInstrumentationMiddleware:
+    """
+    For a REQUEST_INSTRUMENTATION_SAMPLE_RATE share of requests, log the
+    number and time of SQL statements, the slowest one, serializer time and
+    response size as a JSON line, and send the timings in a Server-Timing
+    header. Streamed responses are logged once they are sent, including the
+    queries run while streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.REQUEST_INSTRUMENTATION_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        instrumentation = RequestInstrumentation()
+        token = _current.set(instrumentation)
+        try:
+            with connection.execute_wrapper(instrumentation):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        response['Server-Timing'] = instrumentation.server_timing()
+        if response.streaming:
+            response.streaming_content = self._stream(
+                request, response, instrumentation, response.streaming_content
+            )
+        else:
+            instrumentation.response_bytes = len(response.content)
+            instrumentation.log(request, response)
+        return response
+
+    def _stream(self, request, response, instrumentation, content):
+        instrumentation.response_bytes = 0
+        _current.set(instrumentation)
+        try:
+            with connection.execute_wrapper(instrumentation):
+                for chunk in content:
+                    instrumentation.response_bytes += len(chunk)
+                    yield chunk
+        finally:
+            _current.set(None)
+        instrumentation.log(request, response)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from case_management.models import CaseOfficeDailyMetric
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily per case office report metrics from the audit logs'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            CaseOfficeDailyMetric.objects.rebuild()
+        self.stdout.write(
+            f'Rebuilt {CaseOfficeDailyMetric.objects.count()} daily metrics'
+        )
@@ -0,0 +1,82 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from case_management.synthetic import Scale, SyntheticData
+
+PRESETS = {
+    'demo': Scale(),
+    # 1M legal cases with about 10M logs and 50M log changes
+    'production': Scale(
+        offices=50,
+        users_per_office=10,
+        case_types=20,
+        clients=1000000,
+        cases_per_client=1,
+        updates_per_case=4,
+        changes_per_log=5,
+        days=5 * 365,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate referentially consistent synthetic case offices, users, '
+        'clients, legal cases, case updates and audit logs for load testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--preset',
+            choices=PRESETS,
+            default='demo',
+            help='Scale to start from, the options below override it',
+        )
+        for name in Scale.FIELDS:
+            parser.add_argument(f'--{name.replace("_", "-")}', dest=name, type=int)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--end-date',
+            type=date.fromisoformat,
+            help='Last day of the generated activity, yyyy-mm-dd, defaults to today',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000, help='Legal cases per COPY'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Synthetic data is written with COPY, which needs PostgreSQL'
+            )
+        scale = Scale(
+            **{
+                name: options[name] if options[name] is not None else value
+                for name, value in PRESETS[options['preset']].as_dict().items()
+            }
+        )
+        self.stdout.write(f'Generating {scale} with seed {options["seed"]}')
+        started = time.monotonic()
+
+        def progress(counts):
+            rows = sum(counts.values())
+            seconds = time.monotonic() - started
+            self.stdout.write(
+                f'{counts.get("case_management_legalcase", 0)}/{scale.clients * scale.cases_per_client} '
+                f'legal cases, {rows} rows, {rows / seconds:.0f} rows/s'
+            )
+
+        synthetic_data = SyntheticData(
+            scale, options['seed'], options['end_date'], options['batch_size']
+        )
+        with transaction.atomic():
+            counts = synthetic_data.write(progress)
+
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count}')
+        self.stdout.write(
+            f'Wrote {sum(counts.values())} rows in {time.monotonic() - started:.1f}s'
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from case_management.imports import (
+    IMPORT_FORMATS,
+    CaseImporter,
+    import_format,
+    read_rows,
+)
+from case_management.models import CaseOffice, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Import clients with a legal case each from a CSV or JSONL file into a '
+        'case office. Legal case columns are prefixed with case_'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--case-office', type=int, required=True, help='Case office id'
+        )
+        parser.add_argument('--user', help='Email of the user recorded as creator')
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            help='File format, by default taken from the file extension',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            case_office = CaseOffice.objects.get(id=options['case_office'])
+            user = User.objects.get(email=options['user']) if options['user'] else None
+            file_format = options['format'] or import_format(options['path'])
+        except (CaseOffice.DoesNotExist, User.DoesNotExist, ValueError) as e:
+            raise CommandError(e)
+        importer = CaseImporter(case_office, user, options['chunk_size'])
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            try:
+                result = importer.run(read_rows(file, file_format))
+            except ValueError as e:
+                raise CommandError(f'Import stopped, earlier chunks were imported: {e}')
+        for error in result.errors:
+            self.stderr.write(f'Row {error["row"]}: {error["errors"]}')
+        self.stdout.write(
+            f'Imported {result.created} of {result.rows} rows in '
+            f'{result.seconds:.1f}s ({result.rows_per_second or 0:.0f} rows/s)'
+        )
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from case_management.models import LogOutbox
+
+
+class Command(BaseCommand):
+    help = 'Expand queued audit log outbox records into Log and LogChange rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is empty',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls when the outbox is empty',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expanded = LogOutbox.expand_batch(options['batch_size'])
+            total += expanded
+            if expanded:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(f'Expanded {total} audit log outbox records')
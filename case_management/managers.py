@@ -1,4 +1,6 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import connections, models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -34,3 +36,201 @@ class UserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError(_('Superuser must have is_superuser=True.'))
         return self.create_user(email, password, **extra_fields)
+
+
+# Daily metrics of legal cases in the case offices of {case_offices}, a
+# relation of (legalcase_id, caseoffice_id). A case counts for its offices as
+# opened on the day it was created, as closed on the day of each audit log
+# changing its state to Closed, and as active on the day of each of its audit
+# logs but its deletion. Logs still in the outbox count too.
+DAILY_METRICS = """
+INSERT INTO case_management_caseofficedailymetric (
+    case_office_id, day, metric, value
+)
+SELECT
+    case_office.caseoffice_id,
+    legalcase.created_at::date,
+    'CasesOpened',
+    COUNT(legalcase.id) * %(sign)s
+FROM
+    case_management_legalcase legalcase
+INNER JOIN {case_offices} case_office ON
+    case_office.legalcase_id = legalcase.id
+GROUP BY
+    1, 2
+UNION ALL
+SELECT
+    closed.caseoffice_id,
+    closed.day,
+    'CasesClosed',
+    COUNT(*) * %(sign)s
+FROM (
+    SELECT
+        case_office.caseoffice_id,
+        log.created_at::date AS day
+    FROM
+        case_management_logchange logchange
+    INNER JOIN case_management_log log ON
+        log.id = logchange.log_id
+    INNER JOIN {case_offices} case_office ON
+        case_office.legalcase_id = log.target_id
+    WHERE
+        log.target_type = 'LegalCase'
+        AND logchange.field = 'state'
+        AND logchange.value = 'Closed'
+    UNION ALL
+    SELECT
+        case_office.caseoffice_id,
+        outbox.created_at::date
+    FROM
+        case_management_logoutbox outbox
+    CROSS JOIN jsonb_array_elements(outbox.payload->'changes') change
+    INNER JOIN {case_offices} case_office ON
+        case_office.legalcase_id = (outbox.payload->'log'->>'target_id')::int
+    WHERE
+        outbox.payload->'log'->>'target_type' = 'LegalCase'
+        AND change->>0 = 'state'
+        AND change->>1 = 'Closed'
+) closed
+GROUP BY
+    1, 2
+UNION ALL
+SELECT
+    active.caseoffice_id,
+    active.day,
+    'CasesWithActivity',
+    COUNT(*) * %(sign)s
+FROM (
+    SELECT
+        case_office.caseoffice_id,
+        log.created_at::date AS day
+    FROM
+        case_management_log log
+    INNER JOIN {case_offices} case_office ON
+        case_office.legalcase_id = log.target_id
+    WHERE
+        log.target_type = 'LegalCase'
+        AND log.action <> 'Delete'
+    UNION ALL
+    SELECT
+        case_office.caseoffice_id,
+        outbox.created_at::date
+    FROM
+        case_management_logoutbox outbox
+    INNER JOIN {case_offices} case_office ON
+        case_office.legalcase_id = (outbox.payload->'log'->>'target_id')::int
+    WHERE
+        outbox.payload->'log'->>'target_type' = 'LegalCase'
+        AND outbox.payload->'log'->>'action' <> 'Delete'
+) active
+GROUP BY
+    1, 2
+ON CONFLICT (case_office_id, day, metric)
+DO UPDATE SET value = case_management_caseofficedailymetric.value + EXCLUDED.value"""
+
+
+class DailyMetricManager(models.Manager):
+    def increment(self, case_office_ids, day, metric, value=1):
+        """
+        Add value to the metric of each case office on day
+        """
+        self.add({(case_office_id, day, metric): value for case_office_id in case_office_ids})
+
+    def add(self, values):
+        """
+        Add the values of a {(case office id, day, metric): value} dict,
+        creating missing rows, in a single query.
+        """
+        if not values:
+            return
+        table = self.model._meta.db_table
+        rows = ', '.join(['(%s, %s, %s, %s)'] * len(values))
+        params = []
+        for (case_office_id, day, metric), value in values.items():
+            params.extend([case_office_id, day, metric, value])
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (case_office_id, day, metric, value)
+                VALUES {rows}
+                ON CONFLICT (case_office_id, day, metric)
+                DO UPDATE SET value = {table}.value + EXCLUDED.value""",
+                params,
+            )
+
+    def move_legal_case(self, legal_case_id, case_office_ids, sign):
+        """
+        Add (sign 1) or remove (sign -1) all metrics of the legal case to or
+        from the case offices, when it joins or leaves them.
+        """
+        case_office_ids = list(case_office_ids)
+        if not case_office_ids:
+            return
+        case_offices = (
+            '(SELECT %(legal_case)s::int legalcase_id, '
+            'unnest(%(case_offices)s::int[]) caseoffice_id)'
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                DAILY_METRICS.format(case_offices=case_offices),
+                {'legal_case': legal_case_id, 'case_offices': case_office_ids, 'sign': sign},
+            )
+
+    def rebuild(self):
+        """
+        Recompute all metrics from the legal case and audit log tables.
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.model._meta.db_table}')
+            cursor.execute(
+                DAILY_METRICS.format(case_offices='case_management_legalcase_case_offices'),
+                {'sign': 1},
+            )
+
+
+class CaseNumberSequenceManager(models.Manager):
+    def allocate(self, prefix, count=1):
+        """
+        Reserve the next count numbers of the prefix in a single statement
+        and return the last one. The sequence row stays locked until the
+        transaction ends, so concurrent allocations never collide.
+        """
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (prefix, last_value)
+                VALUES (%s, %s)
+                ON CONFLICT (prefix)
+                DO UPDATE SET last_value = {table}.last_value + EXCLUDED.last_value
+                RETURNING last_value""",
+                [prefix, count],
+            )
+            return cursor.fetchone()[0]
+
+    def advance(self, prefix, last_value):
+        """
+        Continue numbering the prefix after last_value, for case numbers
+        written directly to the database
+        """
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (prefix, last_value)
+                VALUES (%s, %s)
+                ON CONFLICT (prefix)
+                DO UPDATE SET last_value = GREATEST({table}.last_value, EXCLUDED.last_value)""",
+                [prefix, last_value],
+            )
+
+    def next_case_numbers(self, case_office_code, count=1):
+        """
+        Case numbers in the format <case office code>/<yymm>/<number>
+        """
+        prefix = f'{case_office_code}/{timezone.localtime():%y%m}'
+        last_value = self.allocate(prefix, count)
+        return [
+            f'{prefix}/{str(value).zfill(4)}'
+            for value in range(last_value - count + 1, last_value + 1)
+        ]
@@ -0,0 +1,251 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics when
+METRICS_ENABLED is set.
+
+Metrics are kept per process. bin/start.sh runs a single gevent worker, with
+more workers each one reports its own.
+"""
+
+import abc
+import os
+import resource
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Seconds, from fast cached API responses to slow reports
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abc.abstractmethod
+    def samples(self):
+        """(name, labels, value) of every sample, in rendering order"""
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        lines.extend(
+            f'{name}{labels} {_number(value)}' for name, labels, value in self.samples()
+        )
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels):
+        key = self._key(labels)
+        with self.lock:
+            return self.values.get(key, 0)
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield self.name, _labels(self.label_names, key), value
+
+
+class Gauge(Metric):
+    """Gauge read from a function when the metrics are rendered"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, function):
+        super().__init__(name, help)
+        self.function = function
+
+    def samples(self):
+        yield self.name, '', self.function()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, _ = self.values.get(key, ([0], 0))
+            return counts[-1]
+
+    def samples(self):
+        with self.lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self.values.items()
+            )
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                yield (
+                    f'{self.name}_bucket',
+                    _labels(self.label_names, key, [('le', _number(bound))]),
+                    count,
+                )
+            yield f'{self.name}_sum', _labels(self.label_names, key), total
+            yield f'{self.name}_count', _labels(self.label_names, key), counts[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+def _resident_memory_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak instead of current memory where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+registry = Registry()
+
+api_requests = registry.register(
+    Counter(
+        'case_management_api_requests_total',
+        'API requests by view, viewset action and response status',
+        ['view', 'action', 'status'],
+    )
+)
+api_request_duration = registry.register(
+    Histogram(
+        'case_management_api_request_duration_seconds',
+        'API request duration by view and viewset action',
+        ['view', 'action'],
+    )
+)
+report_query_duration = registry.register(
+    Histogram(
+        'case_management_report_query_duration_seconds',
+        'Duration of report queries, run when the report is not cached',
+        ['report'],
+    )
+)
+db_connections = registry.register(
+    Counter(
+        'case_management_db_connections_total',
+        'Database connections opened, CONN_MAX_AGE keeps them open across requests',
+    )
+)
+db_connection_requests = registry.register(
+    Counter(
+        'case_management_db_connection_requests_total',
+        'Requests that used the database, by whether they reused an open connection',
+        ['connection'],
+    )
+)
+registry.register(
+    Gauge(
+        'case_management_process_resident_memory_bytes',
+        'Resident memory of the worker process',
+        _resident_memory_bytes,
+    )
+)
+process_started = time.time()
+registry.register(
+    Gauge(
+        'case_management_process_start_time_seconds',
+        'Start time of the worker process since the epoch',
+        lambda: process_started,
+    )
+)
+registry.register(
+    Gauge('case_management_process_id', 'Id of the worker process', os.getpid)
+)
+
+
+@receiver(connection_created)
+def count_connection(sender, **kwargs):
+    if settings.METRICS_ENABLED:
+        db_connections.inc()
+
+
+def _view_labels(request):
+    match = request.resolver_match
+    view = match.func
+    # Viewsets, and function views through @api_view, keep their class
+    view_class = getattr(view, 'cls', None)
+    actions = getattr(view, 'actions', None)
+    if actions:
+        return view_class.__name__, actions.get(request.method.lower(), '')
+    return match.url_name or match.view_name, request.method.lower()
+
+
+class MetricsMiddleware:
+    """Request counts and durations, and database connection reuse"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        connected = connection.connection is not None
+        started = time.perf_counter()
+        response = self.get_response(request)
+        seconds = time.perf_counter() - started
+        if request.resolver_match is not None:
+            view, action = _view_labels(request)
+            api_requests.inc(view=view, action=action, status=response.status_code)
+            api_request_duration.observe(seconds, view=view, action=action)
+        if connection.connection is not None:
+            db_connection_requests.inc(connection='reused' if connected else 'new')
+        return response
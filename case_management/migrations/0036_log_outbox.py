@@ -0,0 +1,27 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0035_fix_logs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogOutbox',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payload', models.JSONField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='log',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
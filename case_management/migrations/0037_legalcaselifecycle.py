@@ -0,0 +1,53 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_LIFECYCLE = """
+INSERT INTO case_management_legalcaselifecycle (
+    legal_case_id, created_at, closed_at, days_to_close
+)
+SELECT
+    legalcase.id,
+    legalcase.created_at::date,
+    closed.closed_at,
+    closed.closed_at - legalcase.created_at::date
+FROM
+    case_management_legalcase legalcase
+LEFT JOIN (
+    SELECT
+        log.target_id,
+        MAX(log.created_at)::date closed_at
+    FROM
+        case_management_log log
+    INNER JOIN case_management_logchange logchange ON
+        log.id = logchange.log_id
+    WHERE
+        log.target_type = 'LegalCase'
+        AND logchange.field = 'state'
+        AND logchange.value = 'Closed'
+    GROUP BY
+        log.target_id
+) closed ON
+    closed.target_id = legalcase.id"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0036_log_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LegalCaseLifecycle',
+            fields=[
+                ('legal_case', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lifecycle', serialize=False, to='case_management.legalcase')),
+                ('created_at', models.DateField()),
+                ('closed_at', models.DateField(blank=True, null=True)),
+                ('days_to_close', models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunSQL(BACKFILL_LIFECYCLE, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BACKFILL_DAILY_METRICS = """
+INSERT INTO case_management_caseofficedailymetric (
+    case_office_id, day, metric, value
+)
+SELECT
+    case_office.caseoffice_id,
+    legalcase.created_at::date,
+    'CasesOpened',
+    COUNT(legalcase.id)
+FROM
+    case_management_legalcase legalcase
+INNER JOIN case_management_legalcase_case_offices case_office ON
+    case_office.legalcase_id = legalcase.id
+GROUP BY
+    1, 2
+UNION ALL
+SELECT
+    case_office.caseoffice_id,
+    log.created_at::date,
+    'CasesClosed',
+    COUNT(logchange.id)
+FROM
+    case_management_logchange logchange
+INNER JOIN case_management_log log ON
+    log.id = logchange.log_id
+INNER JOIN case_management_legalcase_case_offices case_office ON
+    case_office.legalcase_id = log.target_id
+WHERE
+    log.target_type = 'LegalCase'
+    AND logchange.field = 'state'
+    AND logchange.value = 'Closed'
+GROUP BY
+    1, 2
+UNION ALL
+SELECT
+    case_office.caseoffice_id,
+    log.created_at::date,
+    'CasesWithActivity',
+    COUNT(log.id)
+FROM
+    case_management_log log
+INNER JOIN case_management_legalcase_case_offices case_office ON
+    case_office.legalcase_id = log.target_id
+WHERE
+    log.target_type = 'LegalCase'
+GROUP BY
+    1, 2"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0037_legalcaselifecycle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseOfficeDailyMetric',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('metric', models.CharField(choices=[('CasesOpened', 'Cases opened'), ('CasesClosed', 'Cases closed'), ('CasesWithActivity', 'Cases with activity')], max_length=20)),
+                ('value', models.IntegerField(default=0)),
+                ('case_office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='case_management.caseoffice')),
+            ],
+            options={
+                'unique_together': {('case_office', 'day', 'metric')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_DAILY_METRICS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+SEED_CASE_NUMBER_SEQUENCES = """
+INSERT INTO case_management_casenumbersequence (prefix, last_value)
+SELECT
+    substring(case_number FROM '^(.+)/[0-9]+$'),
+    MAX(substring(case_number FROM '/([0-9]+)$')::integer)
+FROM
+    case_management_legalcase
+WHERE
+    case_number ~ '^.+/[0-9]{4}/[0-9]+$'
+GROUP BY
+    1"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('case_management', '0038_caseofficedailymetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseNumberSequence',
+            fields=[
+                ('prefix', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('last_value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(SEED_CASE_NUMBER_SEQUENCES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:21
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking writes to the audit log tables
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0039_casenumbersequence'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='log',
+            index=models.Index(fields=['parent_type', 'parent_id', '-id'], name='log_parent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='log',
+            index=models.Index(fields=['target_type', 'target_id', '-updated_at'], name='log_target_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='logchange',
+            index=models.Index(condition=models.Q(('field', 'state'), ('value', 'Closed')), fields=['log'], name='logchange_state_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.21 on 2026-10-18 05:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+# pg_trgm is a contrib extension that not every Postgres install ships, search
+# falls back to full-text matches only without it
+CREATE_TRIGRAM_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS client_name_trgm_idx
+            ON case_management_client USING gin (name gin_trgm_ops);
+    END IF;
+END $$"""
+
+DROP_TRIGRAM_INDEX = 'DROP INDEX IF EXISTS client_name_trgm_idx'
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without blocking writes to the searched tables
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0040_log_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGRAM_INDEX, DROP_TRIGRAM_INDEX),
+        AddIndexConcurrently(
+            model_name='client',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', 'preferred_name', 'official_identifier', 'contact_number', config='simple'), name='client_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='legalcase',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('case_number', 'summary', config='english'), name='legalcase_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='meeting',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', 'notes', config='english'), name='meeting_search_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='note',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('title', 'content', config='english'), name='note_search_idx'),
+        ),
+    ]
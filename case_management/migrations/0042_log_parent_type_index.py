@@ -0,0 +1,20 @@
+# Generated by Django 3.2.21 on 2026-10-18 06:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking writes to the audit log
+    atomic = False
+
+    dependencies = [
+        ('case_management', '0041_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='log',
+            index=models.Index(fields=['parent_type', '-id'], name='log_parent_type_idx'),
+        ),
+    ]
@@ -1,10 +1,15 @@
 import os
+from collections import Counter
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from case_management.enums import (
+    DailyMetrics,
     PermissionGroups,
     OfficialIdentifiers,
     CaseStates,
@@ -18,16 +23,38 @@ from case_management.enums import (
 )
 from django_countries.fields import CountryField
 from django.conf import settings
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import post_delete, post_save, m2m_changed
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
-from case_management.managers import UserManager
-from django_lifecycle import LifecycleModel, hook, AFTER_CREATE, AFTER_UPDATE, BEFORE_DELETE
-from django.apps import apps
+from case_management.managers import (
+    CaseNumberSequenceManager,
+    DailyMetricManager,
+    UserManager,
+)
+from django_lifecycle import (
+    LifecycleModel,
+    hook,
+    AFTER_CREATE,
+    AFTER_SAVE,
+    AFTER_UPDATE,
+    BEFORE_CREATE,
+    BEFORE_DELETE,
+)
+from case_management.cache import report_cache, token_cache
+from django.core.exceptions import ObjectDoesNotExist
 
 
 LOG_CHANGE_EXCLUDED_FIELDS = ('id', 'created_at', 'updated_at')
 
+# Full-text search documents, indexed with GIN expression indexes. Queries must
+# use the very same expressions to be served by the indexes.
+CLIENT_SEARCH_VECTOR = SearchVector(
+    'name', 'preferred_name', 'official_identifier', 'contact_number', config='simple'
+)
+LEGAL_CASE_SEARCH_VECTOR = SearchVector('case_number', 'summary', config='english')
+NOTE_SEARCH_VECTOR = SearchVector('title', 'content', config='english')
+MEETING_SEARCH_VECTOR = SearchVector('name', 'notes', config='english')
+
 
 class User(AbstractUser):
     id = models.AutoField(primary_key=True)
@@ -72,7 +99,8 @@ class User(AbstractUser):
 
 class Log(models.Model):
     id = models.AutoField(primary_key=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add, logs expanded from the outbox keep their original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
 
     parent_id = models.IntegerField(null=False, blank=False)
@@ -90,6 +118,21 @@ class Log(models.Model):
 
     note = models.CharField(max_length=500, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # LogViewSet filtered by parent, newest first
+            models.Index(
+                fields=['parent_type', 'parent_id', '-id'], name='log_parent_idx'
+            ),
+            # Client.updates and report joins on the target
+            models.Index(
+                fields=['target_type', 'target_id', '-updated_at'],
+                name='log_target_idx',
+            ),
+            # Newest log of a model and its children, for ETags
+            models.Index(fields=['parent_type', '-id'], name='log_parent_type_idx'),
+        ]
+
     def __str__(self):
         return f'{self.action} - {self.target_type}'
 
@@ -107,15 +150,100 @@ class LogChange(models.Model):
     value = models.TextField(null=True)
     action = models.CharField(max_length=10, choices=LogChangeTypes.choices)
 
+    class Meta:
+        indexes = [
+            # Case closures, as read by the report lifecycle and metrics
+            models.Index(
+                fields=['log'],
+                condition=models.Q(field='state', value=CaseStates.CLOSED),
+                name='logchange_state_closed_idx',
+            ),
+        ]
+
+
+class LogOutbox(models.Model):
+    '''Audit log waiting to be expanded into Log and LogChange rows by the
+    process_log_outbox command. Used instead of Log when AUDIT_LOG_ASYNC is on'''
+
+    id = models.AutoField(primary_key=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    payload = models.JSONField()
+
+    def add_changes(self, changes):
+        value_field = LogChange._meta.get_field('value')
+        self.payload['changes'].extend(
+            [field, value_field.get_prep_value(value), action]
+            for field, value, action in changes
+        )
+
+    @classmethod
+    def expand_batch(cls, batch_size=500):
+        '''Expand up to batch_size outbox records, returns how many were done'''
+        with transaction.atomic():
+            entries = list(
+                cls.objects.select_for_update(skip_locked=True).order_by('id')[
+                    :batch_size
+                ]
+            )
+            if not entries:
+                return 0
+            logs = Log.objects.bulk_create(
+                [
+                    Log(created_at=entry.created_at, **entry.payload['log'])
+                    for entry in entries
+                ]
+            )
+            LogChange.objects.bulk_create(
+                [
+                    LogChange(log=log, field=field, value=value, action=action)
+                    for log, entry in zip(logs, entries)
+                    for field, value, action in entry.payload['changes']
+                ]
+            )
+            cls.objects.filter(id__in=[entry.id for entry in entries]).delete()
+        return len(entries)
+
 
 def _logChange(log, field, value, action):
-    log_change = LogChange(
-        log=log, field=field, value=value, action=action
+    _logChanges(log, [(field, value, action)])
+
+
+def _logChanges(log, changes):
+    '''Write all (field, value, action) changes of a log in a single query'''
+    if isinstance(log, LogOutbox):
+        log.add_changes(changes)
+        log.save(update_fields=['payload'])
+        return
+    LogChange.objects.bulk_create(
+        [
+            LogChange(log=log, field=field, value=value, action=action)
+            for field, value, action in changes
+        ]
     )
-    log_change.save()
 
 
-def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
+def _collectChanges(instance, action):
+    changes = []
+    for field in instance._meta.get_fields():
+        if field.one_to_one and field.auto_created and not field.concrete:
+            # reverse one-to-one relations never show up as changed, skip the
+            # query hasattr would otherwise run
+            continue
+        # has_changed compares foreign key ids, check it before hasattr
+        # loads the related row
+        if (
+            field.name not in LOG_CHANGE_EXCLUDED_FIELDS
+            and (action == 'Create' or instance.has_changed(field.name))
+            and hasattr(instance, field.name)
+        ):
+            value = getattr(instance, field.name)
+            changes.append((field.name, value, LogChangeTypes.CHANGE))
+    return changes
+
+
+def _logFields(
+    self, action, parent_id=None, parent_type=None, user=None, note=None, user_id=None
+):
     target_type = self.__class__.__name__
     target_id = self.id
 
@@ -126,33 +254,76 @@ def logIt(self, action, parent_id=None, parent_type=None, user=None, note=None):
         parent_type = self.__class__.__name__
 
     if note is None:
-        target_model = apps.get_model('case_management', target_type)
-        record = target_model.objects.filter(id=target_id)
-        if record.count() > 0:
-            note = record[0].__str__()
-        else:
+        try:
+            note = self.log_note()
+        except ObjectDoesNotExist:
             note = target_type
-    self.log = Log(
-        parent_id=parent_id,
-        parent_type=parent_type,
-        target_id=target_id,
-        target_type=target_type,
-        action=action,
-        user=user,
-        note=note,
-    )
-    self.log.save()
-    for field in self._meta.get_fields():
-        if (
-            hasattr(self, field.name)
-            and field.name not in LOG_CHANGE_EXCLUDED_FIELDS
-            and (action == 'Create' or self.has_changed(field.name))
-        ):
-            value = getattr(self, field.name)
-            _logChange(self.log, field.name, value, LogChangeTypes.CHANGE)
+    return {
+        'parent_id': parent_id,
+        'parent_type': parent_type,
+        'target_id': target_id,
+        'target_type': target_type,
+        'action': action,
+        'user_id': user.id if user is not None else user_id,
+        'note': note,
+    }
+
+
+def logIt(
+    self, action, parent_id=None, parent_type=None, user=None, note=None, user_id=None
+):
+    '''Audit log of the instance by user, or by the user with user_id when
+    it isn't loaded'''
+    log_fields = _logFields(self, action, parent_id, parent_type, user, note, user_id)
+    changes = _collectChanges(self, action)
+    if settings.AUDIT_LOG_ASYNC:
+        self.log = LogOutbox(payload={'log': log_fields, 'changes': []})
+        self.log.add_changes(changes)
+        self.log.save()
+    else:
+        self.log = Log(**log_fields)
+        self.log.save()
+        _logChanges(self.log, changes)
+    if isinstance(self, LegalCase):
+        countLegalCaseLogs([(self, self.log.created_at, action, changes)])
     return self.log
 
 
+def bulkLogIt(instances, action, user=None, extra_changes=None):
+    '''logIt for many instances in a constant number of queries, for rows
+    written with bulk_create. extra_changes(instance) returns more
+    (field, value, action) changes, e.g. for M2M rows added in bulk'''
+    entries = []
+    for instance in instances:
+        changes = _collectChanges(instance, action)
+        if extra_changes is not None:
+            changes.extend(extra_changes(instance))
+        entries.append((_logFields(instance, action, user=user), changes))
+    if settings.AUDIT_LOG_ASYNC:
+        outbox = []
+        for log_fields, changes in entries:
+            entry = LogOutbox(payload={'log': log_fields, 'changes': []})
+            entry.add_changes(changes)
+            outbox.append(entry)
+        logs = LogOutbox.objects.bulk_create(outbox)
+    else:
+        logs = Log.objects.bulk_create([Log(**log_fields) for log_fields, _ in entries])
+        LogChange.objects.bulk_create(
+            [
+                LogChange(log=log, field=field, value=value, action=change_action)
+                for log, (_, changes) in zip(logs, entries)
+                for field, value, change_action in changes
+            ]
+        )
+    countLegalCaseLogs(
+        [
+            (instance, log.created_at, action, changes)
+            for instance, log, (_, changes) in zip(instances, logs, entries)
+            if isinstance(instance, LegalCase)
+        ]
+    )
+
+
 @receiver(m2m_changed)
 def logManyToManyChange(
     sender, instance=None, action=None, model=None, pk_set=None, **kwargs
@@ -166,7 +337,7 @@ def logManyToManyChange(
         value = list(pk_set)
         if not hasattr(instance, 'log'):
             # logIt has not been called
-            logIt(instance, 'Update', user=instance.updated_by)
+            logIt(instance, 'Update', user_id=instance.updated_by_id)
         _logChange(instance.log, field, value, change_action)
 
 class LoggedModel(LifecycleModel, models.Model):
@@ -180,17 +351,51 @@ class LoggedModel(LifecycleModel, models.Model):
         User, related_name='+', on_delete=models.CASCADE, null=True, editable=False
     )
 
+    def log_note(self):
+        '''Note stored on audit logs of this instance.
+        Override when __str__ follows relations that may not be loaded yet'''
+        return self.__str__()
+
+    def report_case_office_ids(self):
+        '''Case offices whose reports change with this instance, apart from
+        the office of the user making the change'''
+        return []
+
+    def _user_case_office_id(self):
+        '''Case office of the user making the change, without loading the
+        user unless it is loaded already'''
+        field = 'updated_by' if self.updated_by_id is not None else 'created_by'
+        user_id = getattr(self, f'{field}_id')
+        if user_id is None:
+            return None
+        if self._meta.get_field(field).is_cached(self):
+            return getattr(self, field).case_office_id
+        return (
+            User.objects.filter(pk=user_id)
+            .values_list('case_office_id', flat=True)
+            .first()
+        )
+
+    @hook(AFTER_SAVE)
+    @hook(BEFORE_DELETE)
+    def invalidate_reports(self):
+        case_office_ids = self.report_case_office_ids()
+        case_office_ids.append(self._user_case_office_id())
+        report_cache.invalidate(
+            [case_office_id for case_office_id in case_office_ids if case_office_id]
+        )
+
     @hook(AFTER_CREATE)
     def log_create(self):
-        logIt(self, 'Create', user=self.created_by)
+        logIt(self, 'Create', user_id=self.created_by_id)
 
     @hook(AFTER_UPDATE)
     def log_update(self):
-        logIt(self, 'Update', user=self.updated_by)
+        logIt(self, 'Update', user_id=self.updated_by_id)
 
     @hook(BEFORE_DELETE)
     def log_delete(self):
-        logIt(self, 'Delete', user=self.updated_by)
+        logIt(self, 'Delete', user_id=self.updated_by_id)
 
     class Meta:
         abstract = True
@@ -210,15 +415,15 @@ class LoggedChildModel(LoggedModel):
 
     def __log(self, action):
         if action == 'Create':
-            user = self.created_by
+            user_id = self.created_by_id
         else:
-            user = self.updated_by
+            user_id = self.updated_by_id
         logIt(
             self,
             action,
-            parent_id=self.legal_case.id,
+            parent_id=self.legal_case_id,
             parent_type='LegalCase',
-            user=user,
+            user_id=user_id,
         )
         # TODO: for now, only logging against legal_case \
         #   to log against case_update as well, we should probably change the \
@@ -229,7 +434,7 @@ class LoggedChildModel(LoggedModel):
         #         action,
         #         parent_id=self.case_update.id,
         #         parent_type='CaseUpdate',
-        #         user=user,
+        #         user_id=user_id,
         #     )
 
     @hook(AFTER_CREATE)
@@ -256,6 +461,9 @@ class CaseOffice(LoggedModel):
     def __str__(self):
         return self.name
 
+    def report_case_office_ids(self):
+        return [self.id]
+
 
 class CaseType(LoggedModel):
     title = models.CharField(max_length=255, unique=True)
@@ -315,24 +523,57 @@ class Client(LoggedModel):
 
     class Meta:
         unique_together = [['official_identifier', 'official_identifier_type']]
+        # client_name_trgm_idx, for fuzzy name search, is created in migration
+        # 0041 where the pg_trgm extension is available
+        indexes = [GinIndex(CLIENT_SEARCH_VECTOR, name='client_search_idx')]
 
     def __str__(self):
         return self.preferred_name
 
     @property
     def case_offices(self):
+        '''Prefetch legal_cases__case_offices when listing clients'''
+        legal_cases = getattr(self, '_prefetched_objects_cache', {}).get('legal_cases')
+        if legal_cases is not None and all(
+            'case_offices' in getattr(legal_case, '_prefetched_objects_cache', {})
+            for legal_case in legal_cases
+        ):
+            return [
+                case_office
+                for legal_case in legal_cases
+                for case_office in legal_case.case_offices.all()
+            ]
         case_offices = CaseOffice.objects.filter(legalcase__client=self)
         return case_offices
 
     @property
     def updates(self):
-        '''TODO: Do this in scalable way e.g. in view using proper join
-        The below would not scale, because the request is done for each row
-        '''
-        updates = Log.objects.filter(target_type='Client', target_id=self.id).order_by(
-            '-updated_at'
+        '''Use Client.prefetch_updates when listing clients'''
+        if hasattr(self, '_prefetched_updates'):
+            return self._prefetched_updates
+        return Client._updates_queryset().filter(target_id=self.id)
+
+    @staticmethod
+    def _updates_queryset():
+        return (
+            Log.objects.filter(target_type='Client')
+            .select_related('user')
+            .prefetch_related('changes')
+            .order_by('-updated_at')
         )
-        return updates
+
+    @staticmethod
+    def prefetch_updates(clients):
+        '''Load the updates of all clients, with their changes and users, in
+        a constant number of queries'''
+        clients = list(clients)
+        updates = {client.id: [] for client in clients}
+        if updates:
+            for log in Client._updates_queryset().filter(target_id__in=updates):
+                updates[log.target_id].append(log)
+        for client in clients:
+            client._prefetched_updates = updates[client.id]
+        return clients
 
 
 class LegalCase(LoggedModel):
@@ -353,9 +594,144 @@ class LegalCase(LoggedModel):
     respondent_name = models.CharField(max_length=255, blank=True)
     respondent_contact_number = PhoneNumberField(blank=True)
 
+    class Meta:
+        indexes = [GinIndex(LEGAL_CASE_SEARCH_VECTOR, name='legalcase_search_idx')]
+
     def __str__(self):
         return self.case_number
 
+    def case_office_ids(self):
+        if '_case_office_ids' not in self.__dict__:
+            self._case_office_ids = list(
+                self.case_offices.values_list('id', flat=True)
+            )
+        return list(self._case_office_ids)
+
+    def report_case_office_ids(self):
+        return self.case_office_ids()
+
+    @hook(BEFORE_CREATE)
+    def init_case_office_ids(self):
+        # case offices can only be added once the case is saved
+        self._case_office_ids = []
+
+    @hook(AFTER_CREATE)
+    def create_lifecycle(self):
+        LegalCaseLifecycle.for_legal_case(self).save(force_insert=True)
+
+    @hook(AFTER_UPDATE, when='state', has_changed=True, is_now=CaseStates.CLOSED)
+    def close_lifecycle(self):
+        closed_at = timezone.localdate()
+        days_to_close = (closed_at - timezone.localdate(self.created_at)).days
+        LegalCaseLifecycle.objects.filter(legal_case=self).update(
+            closed_at=closed_at, days_to_close=days_to_close
+        )
+
+    @hook(BEFORE_DELETE)
+    def uncount_metrics(self):
+        CaseOfficeDailyMetric.objects.move_legal_case(self.id, self.case_office_ids(), -1)
+
+
+def metricDay(moment):
+    '''Day a time counts for in the daily metrics, as the database casts it'''
+    return timezone.localdate(moment, timezone.utc)
+
+
+def countLegalCaseLogs(entries):
+    '''Count new audit logs of legal cases in the daily metrics of the case
+    offices of the cases, entries are (legal case, log time, action, changes).
+    Follows the rules of managers.DAILY_METRICS'''
+    values = Counter()
+    for legal_case, created_at, action, changes in entries:
+        if action == 'Delete':
+            continue
+        day = metricDay(created_at)
+        closed = sum(
+            1 for field, value, _ in changes if field == 'state' and value == CaseStates.CLOSED
+        )
+        for case_office_id in legal_case.case_office_ids():
+            values[(case_office_id, day, DailyMetrics.CASES_WITH_ACTIVITY)] += 1
+            if closed:
+                values[(case_office_id, day, DailyMetrics.CASES_CLOSED)] += closed
+    CaseOfficeDailyMetric.objects.add(values)
+
+
+@receiver(m2m_changed, sender=LegalCase.case_offices.through)
+def countCaseOfficeChange(
+    sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs
+):
+    '''Move all daily metrics of a case along with it when it joins or leaves
+    case offices, before the audit log of the change is written'''
+    if reverse:
+        return
+    instance.__dict__.pop('_case_office_ids', None)
+    if action == 'pre_add':
+        case_office_ids, sign = pk_set, 1
+    elif action == 'pre_remove':
+        case_office_ids = instance.case_offices.filter(id__in=pk_set).values_list('id', flat=True)
+        sign = -1
+    elif action == 'pre_clear':
+        case_office_ids, sign = instance.case_offices.values_list('id', flat=True), -1
+    else:
+        return
+    case_office_ids = list(case_office_ids)
+    CaseOfficeDailyMetric.objects.move_legal_case(instance.id, case_office_ids, sign)
+    report_cache.invalidate(case_office_ids)
+
+
+class CaseNumberSequence(models.Model):
+    '''Last case number handed out for a case office code and month'''
+
+    prefix = models.CharField(max_length=16, primary_key=True)
+    last_value = models.IntegerField(default=0)
+
+    objects = CaseNumberSequenceManager()
+
+
+class LegalCaseLifecycle(models.Model):
+    '''Open and close dates of a legal case for reporting, kept up to date by
+    LegalCase hooks. closed_at is the last time the case was closed'''
+
+    legal_case = models.OneToOneField(
+        LegalCase,
+        related_name='lifecycle',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    created_at = models.DateField()
+    closed_at = models.DateField(null=True, blank=True)
+    days_to_close = models.IntegerField(null=True, blank=True)
+
+    @classmethod
+    def for_legal_case(cls, legal_case):
+        '''Unsaved lifecycle of a newly created legal case'''
+        created_at = timezone.localdate(legal_case.created_at)
+        closed_at = created_at if legal_case.state == CaseStates.CLOSED else None
+        return cls(
+            legal_case=legal_case,
+            created_at=created_at,
+            closed_at=closed_at,
+            days_to_close=0 if closed_at else None,
+        )
+
+
+class CaseOfficeDailyMetric(models.Model):
+    '''Daily per office counts for the daily summary report. Kept up to date
+    by LegalCase hooks, rebuilt with `manage.py backfill_daily_metrics`'''
+
+    id = models.AutoField(primary_key=True)
+    case_office = models.ForeignKey(
+        CaseOffice, related_name='daily_metrics', on_delete=models.CASCADE
+    )
+    day = models.DateField()
+    metric = models.CharField(max_length=20, choices=DailyMetrics.choices)
+    value = models.IntegerField(default=0)
+
+    objects = DailyMetricManager()
+
+    class Meta:
+        unique_together = [['case_office', 'day', 'metric']]
+
 
 class CaseUpdate(LoggedChildModel):
     legal_case = models.ForeignKey(
@@ -365,6 +741,14 @@ class CaseUpdate(LoggedChildModel):
     def __str__(self):
         return f'{self.legal_case.case_number} case update'
 
+    def log_note(self):
+        if CaseUpdate.legal_case.is_cached(self):
+            return self.__str__()
+        case_number = LegalCase.objects.values_list('case_number', flat=True).get(
+            pk=self.legal_case_id
+        )
+        return f'{case_number} case update'
+
 
 class Note(LoggedChildModel):
     case_update = models.OneToOneField(
@@ -383,6 +767,9 @@ class Note(LoggedChildModel):
         blank=True,
     )
 
+    class Meta:
+        indexes = [GinIndex(NOTE_SEARCH_VECTOR, name='note_search_idx')]
+
     def __str__(self):
         return self.title
 
@@ -419,6 +806,9 @@ class Meeting(LoggedChildModel):
         blank=True,
     )
 
+    class Meta:
+        indexes = [GinIndex(MEETING_SEARCH_VECTOR, name='meeting_search_idx')]
+
     def __str__(self):
         value = self.name if self.name else self.meeting_type
         date = self.meeting_date.strftime('%d %B %Y')
@@ -459,3 +849,16 @@ class File(LoggedChildModel):
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_tokens(sender, instance=None, created=False, update_fields=None, **kwargs):
+    # Logging in only saves last_login
+    if created or not token_cache.enabled or update_fields == frozenset(['last_login']):
+        return
+    token_cache.invalidate(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance=None, **kwargs):
+    token_cache.invalidate([instance.key])
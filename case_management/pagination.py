@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on `-id`, so deep pages cost the same as the first.
+
+    Lists are only paginated when the request passes `page_size` or `cursor`,
+    unless API_ALWAYS_PAGINATE is set, so that existing clients receiving
+    whole lists keep working.
+    """
+
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        if not (
+            settings.API_ALWAYS_PAGINATE
+            or self.page_size_query_param in request.query_params
+            or self.cursor_query_param in request.query_params
+        ):
+            return None
+        return super().get_page_size(request)
+
+
+class SearchPagination(LimitOffsetPagination):
+    '''Search results are ordered by rank, so they're paged by offset'''
+
+    default_limit = 20
+    max_limit = 100
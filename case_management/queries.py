@@ -1,67 +1,57 @@
-LEGALCASE_OPEN_CLOSE = """
-SELECT
-    legalcase.id,
-    legalcase.created_at::date,
-    MAX(CASE
-          WHEN logchange.field = 'state' AND logchange.value = 'Closed'
-          THEN log.created_at
-          ELSE NULL
-      END)::date closed_at
-FROM
-    case_management_legalcase legalcase
-LEFT JOIN case_management_log log ON
-    legalcase.id = log.target_id
-LEFT JOIN case_management_logchange logchange ON
-    log.id = logchange.log_id
-GROUP BY
-    legalcase.id"""
+"""
+Report queries, as constant statements with bound parameters: one for all
+case offices and one with the case office filter pushed down into the CTEs.
+`run` prepares each statement once per database connection, so that Postgres
+parses and plans it once rather than on every report.
+"""
+from collections import namedtuple
+from weakref import WeakKeyDictionary
+
+Query = namedtuple('Query', ['name', 'sql', 'params'])
+
+# Types of the parameters of the prepared statements
+PARAMETER_TYPES = {
+    'start_date': 'date',
+    'end_date': 'date',
+    'start_month': 'date',
+    'end_month': 'date',
+    'case_office': 'bigint',
+}
+
+# Names of the statements prepared on each psycopg2 connection
+_prepared = WeakKeyDictionary()
 
-LEGALCASE_OPEN_CLOSE_DAYS = """
-SELECT
-    *,
-    CASE
-        WHEN closed_at IS NULL
-      THEN NULL
-        ELSE closed_at - created_at
-    END days_created_to_closed
-FROM
-    legalcase_open_close"""
 
+def _office_filter(column, by_office, keyword='AND'):
+    return f"{keyword} {column} = %(case_office)s" if by_office else ""
 
-LEGALCASE_DETAIL_BY_CASEOFFICE = """
+
+def _legalcase_detail_by_caseoffice(by_office):
+    return f"""
 SELECT
-    legalcase.id,
-    legalcase.created_at,
-    legalcase.closed_at,
-    legalcase.days_created_to_closed,
+    lifecycle.legal_case_id id,
+    lifecycle.created_at,
+    lifecycle.closed_at,
+    lifecycle.days_to_close days_created_to_closed,
     case_office.caseoffice_id
 FROM
-    legalcase_open_close_days legalcase,
+    case_management_legalcaselifecycle lifecycle,
     case_management_legalcase_case_offices case_office
 WHERE
-    legalcase.id = case_office.legalcase_id"""
-
+    lifecycle.legal_case_id = case_office.legalcase_id
+    {_office_filter('case_office.caseoffice_id', by_office)}"""
 
-def case_office_filter(case_office=None):
-    phrase = "" if case_office is None else f"WHERE caseoffice.id = '{case_office}'"
-    return phrase
 
-def range_summary(start_date, end_date, case_office=None):
+def _range_summary_sql(by_office):
     return f"""
 WITH
   date_range AS (
   	SELECT
-  		'{start_date}'::date AS start_date,
-  		'{end_date}'::date AS end_date
-  ),
-  legalcase_open_close AS (
-  	{LEGALCASE_OPEN_CLOSE}
-  ),
-  legalcase_open_close_days AS (
-  	{LEGALCASE_OPEN_CLOSE_DAYS}
+  		%(start_date)s::date AS start_date,
+  		%(end_date)s::date AS end_date
   ),
   legalcase_detail_by_caseoffice AS (
-  	{LEGALCASE_DETAIL_BY_CASEOFFICE}
+  	{_legalcase_detail_by_caseoffice(by_office)}
   ),
   metric_cases_opened AS (
   	SELECT
@@ -112,6 +102,7 @@ WITH
   		case_management_user AS users
   	WHERE
   		log.user_id = users.id
+  		{_office_filter('users.case_office_id', by_office)}
   	GROUP BY
   		users.case_office_id,
   		users.name
@@ -138,16 +129,14 @@ WITH
   metric_avg_days_per_case AS (
   	SELECT
   		legalcase.caseoffice_id,
-  		legalcase.days_created_to_closed n
+  		ROUND(AVG(legalcase.days_created_to_closed))::int n
   	FROM
   		legalcase_detail_by_caseoffice legalcase,
   		date_range
   	WHERE
   		legalcase.closed_at BETWEEN date_range.start_date AND date_range.end_date
   	GROUP BY
-  		legalcase.caseoffice_id,
-  		legalcase.days_created_to_closed
-    LIMIT 1
+  		legalcase.caseoffice_id
   )
 SELECT
 	json_object_agg(
@@ -186,9 +175,10 @@ SELECT
 )
 FROM
 	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+{_office_filter('caseoffice.id', by_office, 'WHERE')}"""
 
-def daily_summary(start_month, end_month, case_office=None):
+
+def _daily_summary_sql(by_office):
     return f"""
 WITH
   months AS (
@@ -199,8 +189,8 @@ WITH
   		)::date month_end
   	FROM
   		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp,
+      %(start_month)s::timestamp,
+      %(end_month)s::timestamp,
       '1 month'::INTERVAL
   ) months_series
   ),
@@ -209,59 +199,23 @@ WITH
   		DATE_TRUNC('day', days_series)::date AS DAY
   	FROM
   		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp + '1 month - 1 day',
+      %(start_month)s::timestamp,
+      %(end_month)s::timestamp + '1 month - 1 day',
       '1 day'::INTERVAL
   ) days_series
   ),
-  metric_cases_created AS (
-  	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', legalcase.created_at)::date AS DAY,
-  		COUNT(legalcase.id) n
-  	FROM
-  		case_management_legalcase legalcase,
-  		case_management_legalcase_case_offices case_office
-  	WHERE
-  		legalcase.id = case_office.legalcase_id
-  	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
-  ),
-  metric_cases_closed AS (
+  daily_metrics AS (
   	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', log.created_at)::date AS DAY,
-  		COUNT(logchange.id) n
+  		metric.case_office_id,
+  		metric.day,
+  		metric.metric,
+  		NULLIF(metric.value, 0) n
   	FROM
-  		case_management_logchange logchange
-  	INNER JOIN case_management_log log ON
-  		log.id = logchange.log_id
-  	INNER JOIN case_management_legalcase legalcase ON
-  		legalcase.id = log.target_id
-  	INNER JOIN case_management_legalcase_case_offices case_office ON
-  		case_office.legalcase_id = legalcase.id
+  		case_management_caseofficedailymetric metric
   	WHERE
-  		logchange.field = 'state'
-  		AND logchange.value = 'Closed'
-  	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
-  ),
-  metric_updates AS (
-  	SELECT
-  		case_office.caseoffice_id,
-  		DATE_TRUNC('day', log.created_at)::date AS DAY,
-  		COUNT(log.id) n
-  	FROM
-  		case_management_log log
-  	INNER JOIN case_management_legalcase legalcase ON
-  		legalcase.id = log.target_id
-  	INNER JOIN case_management_legalcase_case_offices case_office ON
-  		case_office.legalcase_id = legalcase.id
-  	GROUP BY
-  		case_office.caseoffice_id,
-  		DAY
+  		metric.day BETWEEN %(start_month)s::date
+  			AND (%(end_month)s::date + INTERVAL '1 month - 1 day')::date
+  		{_office_filter('metric.case_office_id', by_office)}
   )
 SELECT
 	json_object_agg(
@@ -274,8 +228,10 @@ SELECT
                         'date', days.day,
                         'value', (
                             SELECT n
-                            FROM metric_cases_created cases_created
-                            WHERE cases_created.caseoffice_id = caseoffice.id AND cases_created.day = days.day
+                            FROM daily_metrics
+                            WHERE daily_metrics.case_office_id = caseoffice.id
+                                AND daily_metrics.day = days.day
+                                AND daily_metrics.metric = 'CasesOpened'
                         )
                     )
                 )
@@ -293,8 +249,10 @@ SELECT
                         'date', days.day,
                         'value', (
                             SELECT n
-                            FROM metric_cases_closed cases_closed
-                            WHERE cases_closed.caseoffice_id = caseoffice.id AND cases_closed.day = days.day
+                            FROM daily_metrics
+                            WHERE daily_metrics.case_office_id = caseoffice.id
+                                AND daily_metrics.day = days.day
+                                AND daily_metrics.metric = 'CasesClosed'
                         )
                     )
                 )
@@ -312,8 +270,10 @@ SELECT
                         'date', days.day,
                         'value', (
                             SELECT n
-                            FROM metric_updates updates
-                            WHERE updates.caseoffice_id = caseoffice.id AND updates.day = days.day
+                            FROM daily_metrics
+                            WHERE daily_metrics.case_office_id = caseoffice.id
+                                AND daily_metrics.day = days.day
+                                AND daily_metrics.metric = 'CasesWithActivity'
                         )
                     )
                 )
@@ -327,10 +287,10 @@ SELECT
 )
 FROM
 	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+{_office_filter('caseoffice.id', by_office, 'WHERE')}"""
 
 
-def monthly_summary(start_month, end_month, case_office=None):
+def _monthly_summary_sql(by_office):
     return f"""
 WITH
   months AS (
@@ -341,19 +301,13 @@ WITH
   		)::date month_end
   	FROM
   		generate_series(
-      '{start_month}'::timestamp,
-      '{end_month}'::timestamp,
+      %(start_month)s::timestamp,
+      %(end_month)s::timestamp,
       '1 month'::INTERVAL
   ) months_series
   ),
-  legalcase_open_close AS (
-  	{LEGALCASE_OPEN_CLOSE}
-  ),
-  legalcase_open_close_days AS (
-  	{LEGALCASE_OPEN_CLOSE_DAYS}
-  ),
   legalcase_detail_by_caseoffice AS (
-  	{LEGALCASE_DETAIL_BY_CASEOFFICE}
+  	{_legalcase_detail_by_caseoffice(by_office)}
   ),
   metric_cases_opened AS (
   	SELECT
@@ -411,6 +365,7 @@ WITH
   		case_management_user AS users
   	WHERE
   		log.user_id = users.id
+  		{_office_filter('users.case_office_id', by_office)}
   	GROUP BY
   		users.case_office_id,
   		users.name,
@@ -443,7 +398,7 @@ WITH
   	SELECT
   		legalcase.caseoffice_id,
   		months.month,
-  		legalcase.days_created_to_closed n
+  		ROUND(AVG(legalcase.days_created_to_closed))::int n
   	FROM
   		legalcase_detail_by_caseoffice legalcase,
   		months
@@ -451,8 +406,7 @@ WITH
   		legalcase.closed_at BETWEEN months.month AND months.month_end
   	GROUP BY
   		legalcase.caseoffice_id,
-  		months.month,
-  		legalcase.days_created_to_closed
+  		months.month
   )
 SELECT
 	json_object_agg(
@@ -545,4 +499,50 @@ SELECT
 )
 FROM
 	case_management_caseoffice AS caseoffice
-{case_office_filter(case_office)};"""
+{_office_filter('caseoffice.id', by_office, 'WHERE')}"""
+
+
+RANGE_SUMMARY = {by_office: _range_summary_sql(by_office) for by_office in (False, True)}
+DAILY_SUMMARY = {by_office: _daily_summary_sql(by_office) for by_office in (False, True)}
+MONTHLY_SUMMARY = {by_office: _monthly_summary_sql(by_office) for by_office in (False, True)}
+
+
+def _query(name, statements, params, case_office):
+    if case_office is None:
+        return Query(f'report_{name}', statements[False], params)
+    return Query(
+        f'report_{name}_by_office', statements[True], {**params, 'case_office': case_office}
+    )
+
+
+def range_summary(start_date, end_date, case_office=None):
+    params = {'start_date': start_date, 'end_date': end_date}
+    return _query('range_summary', RANGE_SUMMARY, params, case_office)
+
+
+def daily_summary(start_month, end_month, case_office=None):
+    params = {'start_month': start_month, 'end_month': end_month}
+    return _query('daily_summary', DAILY_SUMMARY, params, case_office)
+
+
+def monthly_summary(start_month, end_month, case_office=None):
+    params = {'start_month': start_month, 'end_month': end_month}
+    return _query('monthly_summary', MONTHLY_SUMMARY, params, case_office)
+
+
+def run(cursor, query):
+    """
+    Execute the query as a prepared statement of the cursor's connection,
+    preparing it first if needed, and return the first column of its row.
+    Prepared statements last as long as the connection, whatever becomes of
+    the transaction that prepared them.
+    """
+    prepared = _prepared.setdefault(cursor.connection, set())
+    if query.name not in prepared:
+        types = ', '.join(PARAMETER_TYPES[name] for name in query.params)
+        positions = {name: f'${i}' for i, name in enumerate(query.params, 1)}
+        cursor.execute(f'PREPARE {query.name} ({types}) AS {query.sql % positions}')
+        prepared.add(query.name)
+    placeholders = ', '.join(f'%({name})s' for name in query.params)
+    cursor.execute(f'EXECUTE {query.name} ({placeholders})', query.params)
+    return cursor.fetchone()[0]
@@ -0,0 +1,106 @@
+from functools import lru_cache
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection, models
+from django.db.models import F, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, NullIf
+
+from case_management.models import (
+    CLIENT_SEARCH_VECTOR,
+    LEGAL_CASE_SEARCH_VECTOR,
+    MEETING_SEARCH_VECTOR,
+    NOTE_SEARCH_VECTOR,
+    Client,
+    LegalCase,
+    Meeting,
+    Note,
+)
+
+
+@lru_cache()
+def _trigram_installed(database):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def trigram_installed():
+    return _trigram_installed(connection.settings_dict['NAME'])
+
+
+def _results(queryset, result_type, label, legal_case, rank):
+    # Only annotations, so the columns of all result types line up in the union
+    return queryset.annotate(
+        result_type=Value(result_type, output_field=models.CharField()),
+        result_id=F('id'),
+        label=label,
+        result_legal_case=legal_case,
+        rank=rank,
+    ).values_list('result_type', 'result_id', 'label', 'result_legal_case', 'rank')
+
+
+def _query(text, config):
+    return SearchQuery(text, config=config, search_type='websearch')
+
+
+def search(text, case_office_id=None):
+    """
+    Clients, legal cases, notes and meetings matching the text, best matches
+    first, optionally only of a case office. Returns
+    (result_type, result_id, label, legal_case, rank) rows.
+    """
+    clients = Client.objects.annotate(document=CLIENT_SEARCH_VECTOR)
+    legal_cases = LegalCase.objects.annotate(document=LEGAL_CASE_SEARCH_VECTOR)
+    notes = Note.objects.annotate(document=NOTE_SEARCH_VECTOR)
+    meetings = Meeting.objects.annotate(document=MEETING_SEARCH_VECTOR)
+
+    if case_office_id is not None:
+        case_office_cases = LegalCase.objects.filter(case_offices=case_office_id)
+        clients = clients.filter(id__in=Subquery(case_office_cases.values('client_id')))
+        legal_cases = legal_cases.filter(case_offices=case_office_id)
+        notes = notes.filter(legal_case__in=Subquery(case_office_cases.values('id')))
+        meetings = meetings.filter(
+            legal_case__in=Subquery(case_office_cases.values('id'))
+        )
+
+    client_query = _query(text, 'simple')
+    client_match = Q(document=client_query)
+    client_rank = SearchRank(F('document'), client_query)
+    if trigram_installed():
+        # Fuzzy name matches for misspelt names
+        client_match |= Q(name__trigram_similar=text)
+        client_rank = Greatest(client_rank, TrigramSimilarity('name', text))
+    english_query = _query(text, 'english')
+    no_legal_case = Value(None, output_field=models.IntegerField())
+
+    results = _results(
+        clients.filter(client_match),
+        'client',
+        F('preferred_name'),
+        no_legal_case,
+        client_rank,
+    ).union(
+        _results(
+            legal_cases.filter(document=english_query),
+            'legal_case',
+            F('case_number'),
+            F('id'),
+            SearchRank(F('document'), english_query),
+        ),
+        _results(
+            notes.filter(document=english_query),
+            'note',
+            F('title'),
+            F('legal_case_id'),
+            SearchRank(F('document'), english_query),
+        ),
+        _results(
+            meetings.filter(document=english_query),
+            'meeting',
+            Coalesce(NullIf('name', Value('')), 'meeting_type'),
+            F('legal_case_id'),
+            SearchRank(F('document'), english_query),
+        ),
+        all=True,
+    )
+    return results.order_by('-rank', 'result_type', 'result_id')
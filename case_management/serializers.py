@@ -1,3 +1,4 @@
+from django.db import models
 from rest_framework import serializers
 from django_countries.serializers import CountryFieldMixin
 from case_management.models import (
@@ -13,7 +14,41 @@ from case_management.models import (
     Log,
     LogChange,
 )
+from case_management.auth import get_case_office_scope, permission_is_scoped
 from case_management.enums import MaritalStatuses
+from case_management.instrumentation import serializing
+
+
+class SparseFieldsetMixin:
+    """
+    Serializes only the fields in the `fields` context, if given, and the
+    relations in the `expand` context as nested objects instead of primary
+    keys. Viewsets fill both from `?fields=` and `?expand=`.
+
+    `expandable_fields` maps relation fields to the name of the serializer
+    of their nested objects in `EXPANDABLE_SERIALIZERS`.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.context.get('expand', ()):
+            if name in self.expandable_fields and name in self.fields:
+                serializer_class = EXPANDABLE_SERIALIZERS[self.expandable_fields[name]]
+                self.fields[name] = serializer_class(
+                    many=isinstance(self.fields[name], serializers.ManyRelatedField),
+                    read_only=True,
+                    # nested objects are serialized whole
+                    context={'include_updates': False},
+                )
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
 
 
 class LogChangeSerializer(serializers.ModelSerializer):
@@ -22,7 +57,7 @@ class LogChangeSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class LogSerializer(serializers.ModelSerializer):
+class LogSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     changes = LogChangeSerializer(many=True, read_only=True)
     extra = serializers.ReadOnlyField()
 
@@ -31,19 +66,30 @@ class LogSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ChildModelSerializer(serializers.ModelSerializer):
+class ChildModelSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     case_offices = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {
+        'legal_case': 'LegalCaseSerializer',
+        'case_offices': 'CaseOfficeSerializer',
+    }
 
 
-class CaseTypeSerializer(serializers.ModelSerializer):
+class CaseTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CaseType
         fields = '__all__'
 
 
-class LegalCaseSerializer(serializers.ModelSerializer):
+class LegalCaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     meetings = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     case_number = serializers.CharField(required=False)
+    expandable_fields = {
+        'client': 'ClientSerializer',
+        'users': 'UserListSerializer',
+        'case_types': 'CaseTypeSerializer',
+        'case_offices': 'CaseOfficeSerializer',
+        'meetings': 'MeetingSerializer',
+    }
 
     def validate(self, data):
         if data.get('has_respondent') and not data.get('respondent_name'):
@@ -59,10 +105,54 @@ class LegalCaseSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ClientSerializer(CountryFieldMixin, serializers.ModelSerializer):
+class ClientLegalCaseListSerializer(serializers.ListSerializer):
+    """
+    Legal cases of a client, only those of their case office for scoped users,
+    as the client may also have cases in other case offices
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        request = self.context.get('request')
+        if request is not None and permission_is_scoped(request.user.permission_group):
+            case_office_id = get_case_office_scope(request).case_office_id
+            data = [
+                legal_case
+                for legal_case in data
+                if case_office_id in {case_office.id for case_office in legal_case.case_offices.all()}
+            ]
+        return super().to_representation(data)
+
+
+class ClientLegalCaseSerializer(LegalCaseSerializer):
+    class Meta(LegalCaseSerializer.Meta):
+        list_serializer_class = ClientLegalCaseListSerializer
+
+
+class ClientListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if 'updates' in self.child.fields:
+            if isinstance(data, models.Manager):
+                data = data.all()
+            data = Client.prefetch_updates(data)
+        return super().to_representation(data)
+
+
+class ClientSerializer(SparseFieldsetMixin, CountryFieldMixin, serializers.ModelSerializer):
     legal_cases = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     updates = LogSerializer(many=True, read_only=True)
     case_offices = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {
+        'legal_cases': 'ClientLegalCaseSerializer',
+        'case_offices': 'CaseOfficeSerializer',
+        'users': 'UserListSerializer',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('include_updates', True):
+            self.fields.pop('updates', None)
 
     def validate(self, data):
         if data.get('official_identifier') and not data.get('official_identifier_type'):
@@ -94,9 +184,10 @@ class ClientSerializer(CountryFieldMixin, serializers.ModelSerializer):
     class Meta:
         model = Client
         fields = '__all__'
+        list_serializer_class = ClientListSerializer
 
 
-class CaseOfficeSerializer(serializers.ModelSerializer):
+class CaseOfficeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CaseOffice
         fields = '__all__'
@@ -194,7 +285,7 @@ class CaseUpdateSerializer(ChildModelSerializer):
         fields = '__all__'
 
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -207,7 +298,7 @@ class UserListSerializer(serializers.ModelSerializer):
             'permission_group'
         ]
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -218,3 +309,17 @@ class UserSerializer(serializers.ModelSerializer):
             'membership_number',
             'case_office',
         ]
+
+
+EXPANDABLE_SERIALIZERS = {
+    serializer.__name__: serializer
+    for serializer in (
+        CaseOfficeSerializer,
+        CaseTypeSerializer,
+        ClientLegalCaseSerializer,
+        ClientSerializer,
+        LegalCaseSerializer,
+        MeetingSerializer,
+        UserListSerializer,
+    )
+}
@@ -76,6 +76,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_extensions",
     "rest_framework",
     "phonenumber_field",
@@ -90,10 +91,17 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'case_management.auth.BearerTokenAuthentication',
     ],
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'case_management.pagination.IdCursorPagination',
+    'PAGE_SIZE': env.int("API_PAGE_SIZE", default=100),
 }
 
+# Paginate list endpoints even when the request does not ask for a page
+API_ALWAYS_PAGINATE = env.bool("API_ALWAYS_PAGINATE", False)
+
 MIDDLEWARE = [
+    "case_management.metrics.MetricsMiddleware",
+    "case_management.instrumentation.RequestInstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -143,6 +151,47 @@ DATABASES = {"default": env.db("DATABASE_URL")}
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
 DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)  # noqa F405
 
+# Write audit logs to the LogOutbox table within the request and expand them
+# into Log/LogChange rows with `manage.py process_log_outbox`
+AUDIT_LOG_ASYNC = env.bool("AUDIT_LOG_ASYNC", False)
+
+
+# Share of requests, 0 to 1, whose SQL statements, serializer time and response
+# size are logged and sent in Server-Timing headers. Off by default.
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = env.float(
+    "REQUEST_INSTRUMENTATION_SAMPLE_RATE", default=0
+)
+
+# Serve request, report, database connection and memory metrics of the worker
+# in the Prometheus text format at /metrics, to requests with the bearer token
+# METRICS_TOKEN if set
+METRICS_ENABLED = env.bool("METRICS_ENABLED", False)
+METRICS_TOKEN = env.str("METRICS_TOKEN", default="")
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Use a file or database cache, e.g. dbcache://case_management_cache after
+# `manage.py createcachetable`, to share report results between processes.
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+    "reports": env.cache("REPORTS_CACHE_URL", default="locmemcache://reports"),
+    # Tokens are only cached in a cache every web process shares, e.g.
+    # filecache:///var/tmp/case_management_tokens, so that revoking them reaches
+    # all processes
+    "tokens": env.cache("TOKENS_CACHE_URL", default="dummycache://"),
+}
+CACHES["reports"]["TIMEOUT"] = env.int("REPORTS_CACHE_TIMEOUT", default=60 * 60)
+# Options in REPORTS_CACHE_URL, e.g. ?max_entries=500, take precedence
+CACHES["reports"]["OPTIONS"] = {
+    "MAX_ENTRIES": env.int("REPORTS_CACHE_MAX_ENTRIES", default=1000),
+    **CACHES["reports"].get("OPTIONS", {}),
+}
+CACHES["tokens"]["TIMEOUT"] = env.int("TOKENS_CACHE_TIMEOUT", default=5 * 60)
+CACHES["tokens"]["OPTIONS"] = {
+    "MAX_ENTRIES": env.int("TOKENS_CACHE_MAX_ENTRIES", default=10000),
+    **CACHES["tokens"].get("OPTIONS", {}),
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -206,12 +255,18 @@ logging.config.dictConfig(
                 # exact format is not important, this is the minimum information
                 "format": "%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
             },
+            # messages that are JSON objects, one per line
+            "structured": {"format": "%(message)s"},
         },
         "handlers": {
             "console": {
                 "class": "logging.StreamHandler",
                 "formatter": "console",
             },
+            "structured": {
+                "class": "logging.StreamHandler",
+                "formatter": "structured",
+            },
         },
         "loggers": {
             # root logger
@@ -220,6 +275,11 @@ logging.config.dictConfig(
                 "handlers": ["console"],
             },
             "django.db.backends": {"level": "DEBUG"},
+            "case_management.instrumentation": {
+                "level": "INFO",
+                "handlers": ["structured"],
+                "propagate": False,
+            },
         },
     }
 )
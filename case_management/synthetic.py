@@ -0,0 +1,734 @@
+"""
+Deterministic synthetic data for benchmarks and load tests.
+
+Rows follow the patterns of fixtures/demo-data.json: case offices with their
+users, clients with legal cases numbered <code>/<yymm>/<number>, case updates
+with a note or a meeting, and the audit logs and report tables the hooks would
+have written. The same seed and end date always give the same data.
+
+Rows are generated with explicit primary keys, so they reference each other
+without reading anything back, and written with COPY in batches of legal
+cases, bypassing the ORM save path and its hooks.
+"""
+
+import io
+import random
+from datetime import datetime, time, timedelta
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from case_management.enums import (
+    CaseStates,
+    Genders,
+    Languages,
+    LogChangeTypes,
+    OfficialIdentifiers,
+    PermissionGroups,
+    Provinces,
+)
+from case_management.models import (
+    CaseNumberSequence,
+    CaseOffice,
+    CaseOfficeDailyMetric,
+    CaseType,
+    CaseUpdate,
+    Client,
+    LegalCase,
+    LegalCaseLifecycle,
+    Log,
+    LogChange,
+    Meeting,
+    Note,
+    User,
+)
+
+FIRST_NAMES = (
+    'Thandiwe',
+    'Sipho',
+    'Lerato',
+    'Pieter',
+    'Ayesha',
+    'Themba',
+    'Nomvula',
+    'Johan',
+    'Zanele',
+    'Kagiso',
+    'Fatima',
+    'Bongani',
+    'Naledi',
+    'Riaan',
+)
+LAST_NAMES = (
+    'Nkosi',
+    'Dlamini',
+    'Mokoena',
+    'van der Merwe',
+    'Patel',
+    'Khumalo',
+    'Botha',
+    'Ndlovu',
+    'Naidoo',
+    'Mahlangu',
+    'Jacobs',
+    'Molefe',
+)
+CASE_SUMMARIES = (
+    'Eviction from a rented flat',
+    'Unpaid wages after dismissal',
+    'Maintenance claim for two children',
+    'Dispute about the estate of a late parent',
+    'Application for a child support grant',
+    'Unfair dismissal without a hearing',
+    'Domestic violence protection order',
+)
+NOTE_TITLES = ('Phone call', 'Documents received', 'Follow up', 'Referral')
+MEETING_TYPES = ('In person meeting', 'Phone call', 'Home visit')
+CLOSED_STATE_SHARE = 0.4
+
+
+class Scale:
+    """Number of rows to generate, per case office or per parent row"""
+
+    FIELDS = (
+        'offices',
+        'users_per_office',
+        'case_types',
+        'clients',
+        'cases_per_client',
+        'updates_per_case',
+        'changes_per_log',
+        'days',
+    )
+
+    def __init__(
+        self,
+        offices=2,
+        users_per_office=3,
+        case_types=5,
+        clients=100,
+        cases_per_client=1,
+        updates_per_case=2,
+        changes_per_log=3,
+        days=365,
+    ):
+        self.offices = offices
+        self.users_per_office = users_per_office
+        self.case_types = case_types
+        self.clients = clients
+        self.cases_per_client = cases_per_client
+        self.updates_per_case = updates_per_case
+        self.changes_per_log = changes_per_log
+        self.days = days
+
+    @classmethod
+    def parse(cls, value):
+        """Scale from 'offices=5,clients=1000', fields left out keep their defaults"""
+        kwargs = {}
+        for item in filter(None, (item.strip() for item in value.split(','))):
+            name, _, number = item.partition('=')
+            if name not in cls.FIELDS:
+                raise ValueError(f'Unknown scale {name}, use one of {cls.FIELDS}')
+            kwargs[name] = int(number)
+        return cls(**kwargs)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __str__(self):
+        return ','.join(f'{name}={value}' for name, value in self.as_dict().items())
+
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    """Value in the COPY text format"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return value.translate(COPY_ESCAPES)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+class Table:
+    """
+    Rows of a table to COPY. Rows are tuples of the given columns, the other
+    columns of the model get their field defaults.
+    """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = list(columns)
+        self.rows = []
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        self.default_columns = [name for name in fields if name not in self.columns]
+        self.defaults = ''.join(
+            '\t' + _copy_value(fields[name].get_default())
+            for name in self.default_columns
+        )
+
+    def add(self, *row):
+        self.rows.append(row)
+
+    def copy(self, cursor):
+        if not self.rows:
+            return 0
+        buffer = io.StringIO(
+            ''.join(
+                '\t'.join([_copy_value(value) for value in row]) + self.defaults + '\n'
+                for row in self.rows
+            )
+        )
+        columns = ', '.join(
+            connection.ops.quote_name(name)
+            for name in self.columns + self.default_columns
+        )
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(self.model._meta.db_table)} ({columns}) FROM STDIN',
+            buffer,
+        )
+        count = len(self.rows)
+        self.rows = []
+        return count
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _base36(number, length):
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return ''.join(
+        digits[number // 36**power % 36] for power in reversed(range(length))
+    )
+
+
+class SyntheticData:
+    """
+    Generate and write a synthetic dataset. write() returns the number of rows
+    written per table, batch_size is the number of legal cases per COPY.
+    """
+
+    def __init__(self, scale=None, seed=0, end=None, batch_size=10000):
+        self.scale = scale or Scale()
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.end = end or timezone.localdate()
+        self.batch_size = batch_size
+        self.counts = {}
+
+    def write(self, progress=None):
+        """
+        Write everything in the current transaction. progress(counts) is
+        called after every batch.
+        """
+        self.ids = {
+            model: _next_id(model)
+            for model in (
+                CaseOffice,
+                User,
+                CaseType,
+                Client,
+                LegalCase,
+                CaseUpdate,
+                Note,
+                Meeting,
+                Log,
+                LogChange,
+                LegalCase.case_offices.through,
+                LegalCase.users.through,
+                LegalCase.case_types.through,
+                Client.users.through,
+            )
+        }
+        self.case_numbers = {}
+        with connection.cursor() as cursor:
+            self._copy(cursor, self._offices())
+            for tables in self._batches():
+                self._copy(cursor, tables)
+                if progress is not None:
+                    progress(self.counts)
+            self._finish(cursor)
+        return self.counts
+
+    def _copy(self, cursor, tables):
+        for table in tables:
+            count = table.copy(cursor)
+            name = table.model._meta.db_table
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    def _id(self, model):
+        value = self.ids[model]
+        self.ids[model] += 1
+        return value
+
+    def _time(self, day):
+        return timezone.make_aware(
+            datetime.combine(day, time(8))
+            + timedelta(seconds=self.random.randrange(9 * 3600))
+        )
+
+    def _day(self, after=None, within=None):
+        first = self.end - timedelta(days=self.scale.days - 1)
+        if after is not None:
+            first = max(first, after)
+        days = (self.end - first).days
+        if within is not None:
+            days = min(days, within)
+        return first + timedelta(days=self.random.randint(0, max(days, 0)))
+
+    def _offices(self):
+        offices = Table(
+            CaseOffice,
+            [
+                'id',
+                'created_at',
+                'updated_at',
+                'name',
+                'description',
+                'case_office_code',
+            ],
+        )
+        users = Table(
+            User,
+            [
+                'id',
+                'password',
+                'is_active',
+                'date_joined',
+                'name',
+                'email',
+                'contact_number',
+                'case_office_id',
+                'permission_group',
+            ],
+        )
+        case_types = Table(
+            CaseType, ['id', 'created_at', 'updated_at', 'title', 'description']
+        )
+        started = self._time(self.end - timedelta(days=self.scale.days))
+        self.offices = []
+        for _ in range(self.scale.offices):
+            office_id = self._id(CaseOffice)
+            code = _base36(office_id, 3)
+            offices.add(
+                office_id,
+                started,
+                started,
+                f'Synthetic Case Office {office_id}',
+                f'Synthetic Case Office {office_id}',
+                code,
+            )
+            office_users = []
+            for number in range(self.scale.users_per_office):
+                user_id = self._id(User)
+                users.add(
+                    user_id,
+                    '!',
+                    True,
+                    started,
+                    f'Case Worker {user_id}',
+                    f'worker{user_id}@synthetic.test',
+                    f'+2721555{user_id % 10000:04d}',
+                    office_id,
+                    (
+                        PermissionGroups.ADVICE_OFFICE_ADMIN
+                        if number == 0
+                        else PermissionGroups.CASE_WORKER
+                    ),
+                )
+                office_users.append(user_id)
+            self.offices.append((office_id, code, office_users))
+        self.case_types = []
+        for _ in range(self.scale.case_types):
+            case_type_id = self._id(CaseType)
+            case_types.add(
+                case_type_id,
+                started,
+                started,
+                f'Synthetic Case Type {case_type_id}',
+                f'Synthetic Case Type {case_type_id}',
+            )
+            self.case_types.append(case_type_id)
+        return [offices, users, case_types]
+
+    def _batches(self):
+        clients_per_batch = max(
+            1, self.batch_size // max(1, self.scale.cases_per_client)
+        )
+        for first in range(0, self.scale.clients, clients_per_batch):
+            tables = self._tables()
+            for _ in range(min(clients_per_batch, self.scale.clients - first)):
+                self._client(tables)
+            yield list(tables.values())
+
+    def _tables(self):
+        return {
+            'clients': Table(
+                Client,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'created_by_id',
+                    'updated_by_id',
+                    'name',
+                    'preferred_name',
+                    'official_identifier',
+                    'official_identifier_type',
+                    'contact_number',
+                    'contact_email',
+                    'province',
+                    'gender',
+                    'home_language',
+                ],
+            ),
+            'client_users': Table(Client.users.through, ['id', 'client_id', 'user_id']),
+            'legal_cases': Table(
+                LegalCase,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'created_by_id',
+                    'updated_by_id',
+                    'case_number',
+                    'state',
+                    'client_id',
+                    'summary',
+                ],
+            ),
+            'case_offices': Table(
+                LegalCase.case_offices.through, ['id', 'legalcase_id', 'caseoffice_id']
+            ),
+            'case_users': Table(
+                LegalCase.users.through, ['id', 'legalcase_id', 'user_id']
+            ),
+            'case_types': Table(
+                LegalCase.case_types.through, ['id', 'legalcase_id', 'casetype_id']
+            ),
+            'lifecycles': Table(
+                LegalCaseLifecycle,
+                ['legal_case_id', 'created_at', 'closed_at', 'days_to_close'],
+            ),
+            'case_updates': Table(
+                CaseUpdate,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'created_by_id',
+                    'updated_by_id',
+                    'legal_case_id',
+                ],
+            ),
+            'notes': Table(
+                Note,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'created_by_id',
+                    'updated_by_id',
+                    'case_update_id',
+                    'legal_case_id',
+                    'title',
+                    'content',
+                ],
+            ),
+            'meetings': Table(
+                Meeting,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'created_by_id',
+                    'updated_by_id',
+                    'case_update_id',
+                    'legal_case_id',
+                    'meeting_type',
+                    'meeting_date',
+                    'location',
+                    'notes',
+                ],
+            ),
+            'logs': Table(
+                Log,
+                [
+                    'id',
+                    'created_at',
+                    'updated_at',
+                    'parent_id',
+                    'parent_type',
+                    'target_id',
+                    'target_type',
+                    'action',
+                    'user_id',
+                    'note',
+                ],
+            ),
+            'log_changes': Table(
+                LogChange, ['id', 'log_id', 'field', 'value', 'action']
+            ),
+        }
+
+    def _log(
+        self,
+        tables,
+        created_at,
+        parent_id,
+        parent_type,
+        target_id,
+        target_type,
+        action,
+        user_id,
+        note,
+        changes,
+    ):
+        log_id = self._id(Log)
+        tables['logs'].add(
+            log_id,
+            created_at,
+            created_at,
+            parent_id,
+            parent_type,
+            target_id,
+            target_type,
+            action,
+            user_id,
+            note,
+        )
+        changes = list(changes)
+        # Pad with changes of other fields up to the scale's changes per log
+        for number in range(len(changes), self.scale.changes_per_log):
+            changes.append(
+                (f'field_{number}', f'Value {number}', LogChangeTypes.CHANGE)
+            )
+        for field, value, change_action in changes[
+            : max(1, self.scale.changes_per_log)
+        ]:
+            tables['log_changes'].add(
+                self._id(LogChange), log_id, field, value, change_action
+            )
+
+    def _client(self, tables):
+        office_id, code, office_users = self.random.choice(self.offices)
+        user_id = self.random.choice(office_users)
+        client_id = self._id(Client)
+        name = f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}'
+        created_day = self._day()
+        created_at = self._time(created_day)
+        tables['clients'].add(
+            client_id,
+            created_at,
+            created_at,
+            user_id,
+            user_id,
+            name,
+            name.split()[0],
+            f'{client_id:013d}',
+            OfficialIdentifiers.NATIONAL_ID,
+            f'+2782{client_id % 10000000:07d}',
+            f'client{client_id}@synthetic.test',
+            self.random.choice(Provinces.values),
+            self.random.choice(Genders.values),
+            self.random.choice(Languages.values),
+        )
+        tables['client_users'].add(self._id(Client.users.through), client_id, user_id)
+        self._log(
+            tables,
+            created_at,
+            client_id,
+            'Client',
+            client_id,
+            'Client',
+            'Create',
+            user_id,
+            name.split()[0],
+            [('name', name, LogChangeTypes.CHANGE)],
+        )
+        for _ in range(self.scale.cases_per_client):
+            self._legal_case(tables, client_id, office_id, code, user_id, created_day)
+
+    def _legal_case(self, tables, client_id, office_id, code, user_id, client_day):
+        legal_case_id = self._id(LegalCase)
+        created_day = self._day(after=client_day, within=30)
+        created_at = self._time(created_day)
+        prefix = f'{code}/{created_day:%y%m}'
+        self.case_numbers[prefix] = self.case_numbers.get(prefix, 0) + 1
+        case_number = f'{prefix}/{str(self.case_numbers[prefix]).zfill(4)}'
+        closed_day = None
+        if self.random.random() < CLOSED_STATE_SHARE:
+            state = CaseStates.CLOSED
+            closed_day = self._day(after=created_day, within=120)
+        else:
+            state = self.random.choice(
+                [value for value in CaseStates.values if value != CaseStates.CLOSED]
+            )
+        updated_at = self._time(closed_day) if closed_day else created_at
+        tables['legal_cases'].add(
+            legal_case_id,
+            created_at,
+            updated_at,
+            user_id,
+            user_id,
+            case_number,
+            state,
+            client_id,
+            self.random.choice(CASE_SUMMARIES),
+        )
+        tables['case_offices'].add(
+            self._id(LegalCase.case_offices.through), legal_case_id, office_id
+        )
+        tables['case_users'].add(
+            self._id(LegalCase.users.through), legal_case_id, user_id
+        )
+        if self.case_types:
+            tables['case_types'].add(
+                self._id(LegalCase.case_types.through),
+                legal_case_id,
+                self.random.choice(self.case_types),
+            )
+        tables['lifecycles'].add(
+            legal_case_id,
+            created_day,
+            closed_day,
+            (closed_day - created_day).days if closed_day else None,
+        )
+        self._log(
+            tables,
+            created_at,
+            legal_case_id,
+            'LegalCase',
+            legal_case_id,
+            'LegalCase',
+            'Create',
+            user_id,
+            case_number,
+            [
+                ('case_number', case_number, LogChangeTypes.CHANGE),
+                ('state', CaseStates.OPENED, LogChangeTypes.CHANGE),
+                ('case_offices', f'[{office_id}]', LogChangeTypes.ADD),
+            ],
+        )
+        for _ in range(self.scale.updates_per_case):
+            self._case_update(
+                tables, legal_case_id, case_number, user_id, created_day, closed_day
+            )
+        if closed_day:
+            self._log(
+                tables,
+                updated_at,
+                legal_case_id,
+                'LegalCase',
+                legal_case_id,
+                'LegalCase',
+                'Update',
+                user_id,
+                case_number,
+                [('state', CaseStates.CLOSED, LogChangeTypes.CHANGE)],
+            )
+
+    def _case_update(
+        self, tables, legal_case_id, case_number, user_id, created_day, closed_day
+    ):
+        case_update_id = self._id(CaseUpdate)
+        day = self._day(
+            after=created_day, within=((closed_day or self.end) - created_day).days
+        )
+        created_at = self._time(day)
+        tables['case_updates'].add(
+            case_update_id, created_at, created_at, user_id, user_id, legal_case_id
+        )
+        note = f'{case_number} case update'
+        self._log(
+            tables,
+            created_at,
+            legal_case_id,
+            'LegalCase',
+            case_update_id,
+            'CaseUpdate',
+            'Create',
+            user_id,
+            note,
+            [('legal_case', legal_case_id, LogChangeTypes.CHANGE)],
+        )
+        if self.random.random() < 0.5:
+            note_id = self._id(Note)
+            title = self.random.choice(NOTE_TITLES)
+            tables['notes'].add(
+                note_id,
+                created_at,
+                created_at,
+                user_id,
+                user_id,
+                case_update_id,
+                legal_case_id,
+                title,
+                f'{title} about {case_number}',
+            )
+            self._log(
+                tables,
+                created_at,
+                legal_case_id,
+                'LegalCase',
+                note_id,
+                'Note',
+                'Create',
+                user_id,
+                title,
+                [('title', title, LogChangeTypes.CHANGE)],
+            )
+        else:
+            meeting_id = self._id(Meeting)
+            meeting_type = self.random.choice(MEETING_TYPES)
+            tables['meetings'].add(
+                meeting_id,
+                created_at,
+                created_at,
+                user_id,
+                user_id,
+                case_update_id,
+                legal_case_id,
+                meeting_type,
+                created_at,
+                'Advice office',
+                f'{meeting_type} about {case_number}',
+            )
+            self._log(
+                tables,
+                created_at,
+                legal_case_id,
+                'LegalCase',
+                meeting_id,
+                'Meeting',
+                'Create',
+                user_id,
+                f'{meeting_type} on {day:%d %B %Y}',
+                [('meeting_type', meeting_type, LogChangeTypes.CHANGE)],
+            )
+
+    def _finish(self, cursor):
+        # Explicit primary keys leave the sequences behind
+        for sql in connection.ops.sequence_reset_sql(no_style(), list(self.ids)):
+            cursor.execute(sql)
+        for prefix, last_value in self.case_numbers.items():
+            CaseNumberSequence.objects.advance(prefix, last_value)
+        # Plan the queries below, and any later ones, with statistics of the new rows
+        for table in self.counts:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+        CaseOfficeDailyMetric.objects.rebuild()
+        cursor.execute(
+            f'ANALYZE {connection.ops.quote_name(CaseOfficeDailyMetric._meta.db_table)}'
+        )
@@ -1,6 +1,46 @@
-from django.test import Client, TestCase
+import csv
+import json
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.postgres.search import SearchQuery
+from django.utils import timezone
 
 import html5lib
+from rest_framework.test import APIClient
+
+from case_management import metrics, queries
+from case_management.cache import ReportCache, report_cache, token_cache
+from case_management.imports import CaseImporter
+from case_management.search import trigram_installed
+from case_management.models import (
+    CLIENT_SEARCH_VECTOR,
+    CaseNumberSequence,
+    CaseOffice,
+    CaseOfficeDailyMetric,
+    CaseType,
+    CaseUpdate,
+    Client as ClientModel,
+    LegalCase,
+    LegalCaseLifecycle,
+    Log,
+    LogChange,
+    LogOutbox,
+    Meeting,
+    Note,
+    User,
+)
+from case_management.views import ClientViewSet
 
 
 class IndexTestCase(TestCase):
@@ -14,6 +54,1264 @@ class IndexTestCase(TestCase):
         assertValidHTML(response.content)
 
 
+class AuditLogTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office'
+        )
+
+    def test_client_create_query_count(self):
+        # savepoint, client insert, log insert, bulk log change insert,
+        # release savepoint
+        with self.assertNumQueries(5):
+            client = ClientModel.objects.create(name='Test client')
+        log = Log.objects.get(target_type='Client', target_id=client.id)
+        self.assertEqual(log.action, 'Create')
+        self.assertEqual(
+            LogChange.objects.get(log=log, field='name').value, 'Test client'
+        )
+
+    def test_legal_case_create_query_count(self):
+        client = ClientModel.objects.create(name='Test client')
+        # as for clients, plus the lifecycle insert
+        with self.assertNumQueries(6):
+            legal_case = LegalCase.objects.create(
+                case_number='T00/0001', client=client
+            )
+        log = Log.objects.get(target_type='LegalCase', target_id=legal_case.id)
+        self.assertEqual(
+            LogChange.objects.get(log=log, field='state').value, 'Opened'
+        )
+        self.assertEqual(log.note, 'T00/0001')
+
+    def test_case_update_log_note(self):
+        client = ClientModel.objects.create(name='Test client')
+        legal_case = LegalCase.objects.create(case_number='T00/0001', client=client)
+        with self.assertNumQueries(5):
+            case_update = CaseUpdate.objects.create(legal_case=legal_case)
+        log = Log.objects.get(target_type='CaseUpdate', target_id=case_update.id)
+        self.assertEqual(log.note, 'T00/0001 case update')
+        self.assertEqual(log.parent_id, legal_case.id)
+
+        case_update = CaseUpdate.objects.get(pk=case_update.id)
+        self.assertEqual(case_update.log_note(), 'T00/0001 case update')
+
+
+@override_settings(AUDIT_LOG_ASYNC=True)
+class AuditLogOutboxTestCase(TestCase):
+    def test_create_writes_outbox(self):
+        # savepoint, client insert, outbox insert, release savepoint
+        with self.assertNumQueries(4):
+            client = ClientModel.objects.create(name='Test client')
+        self.assertFalse(Log.objects.exists())
+        outbox = LogOutbox.objects.get()
+        self.assertEqual(outbox.payload['log']['target_id'], client.id)
+        self.assertIn(['name', 'Test client', 'Change'], outbox.payload['changes'])
+
+    def test_process_log_outbox(self):
+        client = ClientModel.objects.create(name='Test client')
+        legal_case = LegalCase.objects.create(case_number='T00/0001', client=client)
+        legal_case.case_offices.add(
+            CaseOffice.objects.create(name='Test office', description='Test office')
+        )
+        queued_at = LogOutbox.objects.get(payload__log__target_type='LegalCase').created_at
+
+        call_command('process_log_outbox', '--batch-size', '1', stdout=StringIO())
+
+        self.assertFalse(LogOutbox.objects.exists())
+        log = Log.objects.get(target_type='LegalCase', target_id=legal_case.id)
+        self.assertEqual(log.created_at, queued_at)
+        self.assertEqual(log.note, 'T00/0001')
+        self.assertTrue(
+            LogChange.objects.filter(log=log, field='case_offices', action='Add').exists()
+        )
+        self.assertEqual(Log.objects.count(), 3)
+
+
+class ReportsTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office'
+        )
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        report_cache.cache.clear()
+        client = ClientModel.objects.create(name='Test client')
+        self.legal_case = LegalCase.objects.create(
+            case_number='T00/0001', client=client, created_by=self.user
+        )
+        self.legal_case.case_offices.add(self.case_office)
+
+    def test_lifecycle(self):
+        lifecycle = LegalCaseLifecycle.objects.get(legal_case=self.legal_case)
+        self.assertEqual(lifecycle.created_at, self.legal_case.created_at.date())
+        self.assertIsNone(lifecycle.closed_at)
+
+        self.legal_case.state = 'Closed'
+        self.legal_case.save()
+        lifecycle.refresh_from_db()
+        self.assertEqual(lifecycle.closed_at, lifecycle.created_at)
+        self.assertEqual(lifecycle.days_to_close, 0)
+
+    def test_range_summary(self):
+        self.legal_case.state = 'Closed'
+        self.legal_case.save()
+        response = self.api.get('/api/v1/reports/range-summary')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['dataPerCaseOffice']['Test office']
+        self.assertEqual(data['Cases opened'], 1)
+        self.assertEqual(data['Cases closed'], 1)
+        self.assertEqual(data['Average days per case'], 1)
+
+    def test_monthly_summary(self):
+        response = self.api.get('/api/v1/reports/monthly-summary')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['dataPerCaseOffice']['Test office']
+        self.assertEqual(data['Cases opened'][-1]['value'], 1)
+        self.assertEqual(data['Total cases'][-1]['value'], 1)
+
+    def test_average_days_per_case(self):
+        client = ClientModel.objects.get()
+        for days in (0, 3, 5):
+            legal_case = LegalCase.objects.create(
+                case_number=f'T00/{days}', client=client, state='Closed'
+            )
+            legal_case.case_offices.add(self.case_office)
+            LegalCaseLifecycle.objects.filter(legal_case=legal_case).update(
+                days_to_close=days
+            )
+        response = self.api.get('/api/v1/reports/monthly-summary')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['dataPerCaseOffice']['Test office']
+        # mean of 0, 3 and 5 days, plus the day the case closed
+        self.assertEqual(data['Average days per case'][-1]['value'], 4)
+        report_cache.cache.clear()
+        data = self.api.get('/api/v1/reports/range-summary').json()['dataPerCaseOffice']
+        self.assertEqual(data['Test office']['Average days per case'], 4)
+
+    def test_daily_metrics(self):
+        self.legal_case.state = 'Closed'
+        self.legal_case.save()
+        metrics = dict(
+            CaseOfficeDailyMetric.objects.filter(
+                case_office=self.case_office
+            ).values_list('metric', 'value')
+        )
+        self.assertEqual(
+            metrics,
+            {'CasesOpened': 1, 'CasesClosed': 1, 'CasesWithActivity': 2},
+        )
+
+        call_command('backfill_daily_metrics', stdout=StringIO())
+        rebuilt = dict(
+            CaseOfficeDailyMetric.objects.filter(
+                case_office=self.case_office
+            ).values_list('metric', 'value')
+        )
+        self.assertEqual(rebuilt, metrics)
+
+    def test_daily_metrics_match_rebuild(self):
+        for audit_log_async in (False, True):
+            with self.subTest(audit_log_async=audit_log_async), override_settings(
+                AUDIT_LOG_ASYNC=audit_log_async
+            ):
+                other_office = CaseOffice.objects.create(
+                    name=f'Other office {audit_log_async}', description='Other office'
+                )
+                client = ClientModel.objects.get()
+                created_closed = LegalCase.objects.create(
+                    case_number=f'T01/{audit_log_async}', client=client, state='Closed'
+                )
+                created_closed.case_offices.add(self.case_office)
+                moved = LegalCase.objects.create(
+                    case_number=f'T02/{audit_log_async}', client=client
+                )
+                moved.case_offices.add(self.case_office)
+                moved.state = 'Closed'
+                moved.save()
+                moved.case_offices.add(other_office)
+                moved.case_offices.remove(self.case_office)
+                moved.users.add(self.user)
+                deleted = LegalCase.objects.create(
+                    case_number=f'T03/{audit_log_async}', client=client
+                )
+                deleted.case_offices.add(other_office)
+                deleted.summary = 'Updated'
+                deleted.save()
+                deleted.delete()
+
+                def metrics():
+                    return set(
+                        CaseOfficeDailyMetric.objects.exclude(value=0).values_list(
+                            'case_office', 'day', 'metric', 'value'
+                        )
+                    )
+
+                live = metrics()
+                CaseOfficeDailyMetric.objects.rebuild()
+                self.assertEqual(live, metrics())
+
+    def test_daily_summary(self):
+        response = self.api.get('/api/v1/reports/daily-summary')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['dataPerCaseOffice']['Test office']
+        month = self.legal_case.created_at.strftime('%Y-%m')
+        day = self.legal_case.created_at.strftime('%Y-%m-%d')
+        opened = {d['date']: d['value'] for d in data['Cases opened'][month]}
+        self.assertEqual(opened[day], 1)
+        self.assertEqual(sum(v for v in opened.values() if v), 1)
+
+    def test_case_office_filter(self):
+        other_office = CaseOffice.objects.create(
+            name='Other office', description='Other office'
+        )
+        for report in ('range-summary', 'monthly-summary', 'daily-summary'):
+            url = f'/api/v1/reports/{report}'
+            data = self.api.get(url).json()['dataPerCaseOffice']
+            self.assertEqual(set(data), {'Test office', 'Other office'})
+            data = self.api.get(url, {'caseOffice': other_office.id}).json()['dataPerCaseOffice']
+            self.assertEqual(set(data), {'Other office'})
+            response = self.api.get(url, {'caseOffice': "1' OR '1' = '1"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_prepared_statement(self):
+        query = queries.range_summary('2022-01-01', '2022-12-31', self.case_office.id)
+        with connection.cursor() as cursor:
+            first = queries.run(cursor, query)
+        with CaptureQueriesContext(connection) as captured:
+            with connection.cursor() as cursor:
+                self.assertEqual(queries.run(cursor, query), first)
+        [executed] = captured
+        self.assertTrue(executed['sql'].startswith('EXECUTE report_range_summary_by_office'))
+        self.assertEqual(set(first), {'Test office'})
+
+    def test_report_cache(self):
+        other_office = CaseOffice.objects.create(
+            name='Other office', description='Other office'
+        )
+        url = '/api/v1/reports/range-summary'
+        stats = report_cache.stats()
+        self.api.get(url)
+        self.api.get(url)
+        self.api.get(url, {'caseOffice': other_office.id})
+        self.assertEqual(report_cache.hits - stats['hits'], 1)
+        self.assertEqual(report_cache.misses - stats['misses'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.legal_case.state = 'Closed'
+            self.legal_case.save()
+        response = self.api.get(url)
+        data = response.json()['dataPerCaseOffice']['Test office']
+        self.assertEqual(data['Cases closed'], 1)
+        self.api.get(url, {'caseOffice': other_office.id})
+        self.assertEqual(report_cache.hits - stats['hits'], 2)
+        self.assertEqual(report_cache.misses - stats['misses'], 3)
+
+        response = self.api.get('/api/v1/cache-stats')
+        self.assertEqual(response.json()['reports'], report_cache.stats())
+        # Counted in the cache backend, as every process sees them
+        self.assertEqual(ReportCache().stats(), report_cache.stats())
+
+    def test_invalidation_user_case_office(self):
+        def user_queries(legal_case):
+            with CaptureQueriesContext(connection) as queries:
+                legal_case.save()
+            return [q['sql'] for q in queries if 'FROM "case_management_user"' in q['sql']]
+
+        self.legal_case.updated_by = self.user
+        self.assertEqual(user_queries(self.legal_case), [])
+        legal_case = LegalCase.objects.get(id=self.legal_case.id)
+        [query] = user_queries(legal_case)
+        self.assertTrue(query.startswith('SELECT "case_management_user"."case_office_id" FROM'))
+
+
+class ClientApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', name='Admin', permission_group='Admin'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_clients(self, count):
+        for i in range(count):
+            client = ClientModel.objects.create(
+                name=f'Client {i}', created_by=self.user
+            )
+            client.name = f'Client {i} updated'
+            client.save()
+
+    def count_list_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/v1/clients/', params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_leaves_out_updates(self):
+        self.create_clients(1)
+        _, clients = self.count_list_queries({})
+        self.assertNotIn('updates', clients[0])
+
+        response = self.api.get(f'/api/v1/clients/{clients[0]["id"]}/')
+        self.assertEqual(len(response.json()['updates']), 2)
+
+    def test_list_updates_query_count(self):
+        self.create_clients(1)
+        without_updates, _ = self.count_list_queries({})
+        with_updates, clients = self.count_list_queries({'include': 'updates'})
+        updates = clients[0]['updates']
+        self.assertEqual([log['action'] for log in updates], ['Update', 'Create'])
+        self.assertEqual(updates[1]['extra'], {'user': {'name': 'Admin'}})
+        self.assertIn('name', [change['field'] for change in updates[0]['changes']])
+
+        self.create_clients(5)
+        more_without_updates, _ = self.count_list_queries({})
+        more_with_updates, _ = self.count_list_queries({'include': 'updates'})
+        # logs with their users, and log changes
+        self.assertEqual(with_updates - without_updates, 2)
+        self.assertEqual(more_with_updates - more_without_updates, 2)
+
+    def test_cursor_pagination(self):
+        self.create_clients(5)
+        response = self.api.get('/api/v1/clients/', {'page_size': 2})
+        page = response.json()
+        self.assertEqual(len(page['results']), 2)
+        ids = [client['id'] for client in page['results']]
+        while page['next']:
+            page = self.api.get(page['next']).json()
+            ids.extend(client['id'] for client in page['results'])
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), 5)
+
+        self.assertEqual(len(self.api.get('/api/v1/clients/').json()), 5)
+        with override_settings(API_ALWAYS_PAGINATE=True):
+            page = self.api.get('/api/v1/clients/').json()
+        self.assertEqual(len(page['results']), 5)
+        self.assertIsNone(page['next'])
+
+    def test_stream(self):
+        response = self.api.get('/api/v1/clients/', {'stream': '1'})
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+        self.create_clients(3)
+        expected = self.api.get('/api/v1/clients/', {'include': 'updates'}).json()
+        with mock.patch.object(ClientViewSet, 'stream_chunk_size', 2):
+            response = self.api.get(
+                '/api/v1/clients/', {'include': 'updates', 'stream': '1'}
+            )
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(content), expected)
+
+
+class CaseNumberTestCase(TransactionTestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office', case_office_code='T00'
+        )
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        self.client_id = ClientModel.objects.create(name='Test client').id
+
+    def create_case(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        try:
+            return api.post(
+                '/api/v1/cases/',
+                {
+                    'client': self.client_id,
+                    'case_offices': [self.case_office.id],
+                    'users': [self.user.id],
+                },
+                format='json',
+            )
+        finally:
+            connection.close()
+
+    def test_case_numbers_follow_sequence(self):
+        LegalCase.objects.create(
+            case_number=f'T00/{timezone.now():%y%m}/0007', client_id=self.client_id
+        )
+        CaseNumberSequence.objects.create(prefix=f'T00/{timezone.now():%y%m}', last_value=7)
+        response = self.create_case()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['case_number'], f'T00/{timezone.now():%y%m}/0008')
+
+    def test_concurrent_creates(self):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(lambda _: self.create_case(), range(40)))
+        self.assertEqual([r.status_code for r in responses], [201] * 40)
+        case_numbers = sorted(r.json()['case_number'] for r in responses)
+        self.assertEqual(
+            case_numbers,
+            [f'T00/{timezone.now():%y%m}/{str(i).zfill(4)}' for i in range(1, 41)],
+        )
+
+    def test_rolled_back_numbers_are_reused(self):
+        prefix = f'T00/{timezone.now():%y%m}'
+        self.assertEqual(self.create_case().json()['case_number'], f'{prefix}/0001')
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(CaseNumberSequence.objects.allocate(prefix, 2), 3)
+                raise RuntimeError
+        self.assertEqual(self.create_case().json()['case_number'], f'{prefix}/0002')
+        CaseNumberSequence.objects.advance(prefix, 10)
+        self.assertEqual(
+            CaseNumberSequence.objects.next_case_numbers('T00'), [f'{prefix}/0011']
+        )
+
+    def test_case_offices_required(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post(
+            '/api/v1/cases/',
+            {'client': self.client_id, 'case_offices': [], 'users': [self.user.id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('case_offices', response.json())
+
+
+class LogIndexTestCase(TestCase):
+    def setUp(self):
+        client = ClientModel.objects.create(name='Test client')
+        for i in range(20):
+            legal_case = LegalCase.objects.create(
+                case_number=f'T00/{i}', client=client
+            )
+            legal_case.state = 'Closed'
+            legal_case.save()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE case_management_log')
+            cursor.execute('ANALYZE case_management_logchange')
+            # the seeded tables are small enough for sequential scans to win
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_parent_lookup(self):
+        self.assertUsesIndex(
+            Log.objects.filter(parent_type='LegalCase', parent_id=1).order_by('-id'),
+            'log_parent_idx',
+        )
+
+    def test_target_lookup(self):
+        self.assertUsesIndex(
+            ClientModel._updates_queryset().filter(target_id=1), 'log_target_idx'
+        )
+
+    def test_closed_state_changes(self):
+        self.assertUsesIndex(
+            LogChange.objects.filter(field='state', value='Closed').values('log_id'),
+            'logchange_state_closed_idx',
+        )
+
+
+class ScopedPermissionTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office', case_office_code='T00'
+        )
+        other_office = CaseOffice.objects.create(
+            name='Other office', description='Other office', case_office_code='T01'
+        )
+        self.user = User.objects.create_user(
+            'worker@test.test', 'password', permission_group='CaseWorker',
+            case_office=self.case_office,
+        )
+        client = ClientModel.objects.create(name='Test client')
+        self.legal_case = LegalCase.objects.create(case_number='T00/1', client=client)
+        self.legal_case.case_offices.add(self.case_office)
+        self.other_case = LegalCase.objects.create(case_number='T01/1', client=client)
+        self.other_case.case_offices.add(other_office)
+        for i in range(50):
+            LegalCase.objects.create(
+                case_number=f'T00/{i + 2}', client=client
+            ).case_offices.add(self.case_office)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def get_logs(self, legal_case):
+        return self.api.get(
+            '/api/v1/logs/',
+            {'parent_type': 'LegalCase', 'parent_id': legal_case.id},
+        )
+
+    def test_log_list_in_scope(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_logs(self.legal_case)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json())
+        scope_queries = [q for q in queries if 'case_management_legalcase_case_offices' in q['sql']]
+        self.assertEqual(len(scope_queries), 1)
+        self.assertIn('LIMIT 1', scope_queries[0]['sql'])
+
+    def test_log_list_out_of_scope(self):
+        self.assertEqual(self.get_logs(self.other_case).status_code, 403)
+
+    def count_scope_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(url)
+        scope_queries = [
+            q for q in queries
+            if 'case_management_legalcase_case_offices' in q['sql'] and 'LIMIT 1' in q['sql']
+        ]
+        return response.status_code, len(scope_queries)
+
+    def test_object_permissions(self):
+        note = Note.objects.create(legal_case=self.legal_case, title='Note', content='In scope')
+        other_note = Note.objects.create(legal_case=self.other_case, title='Note', content='Out of scope')
+        self.assertEqual(self.count_scope_queries(f'/api/v1/notes/{note.id}/'), (200, 1))
+        self.assertEqual(self.count_scope_queries(f'/api/v1/notes/{other_note.id}/'), (403, 1))
+        self.assertEqual(self.count_scope_queries(f'/api/v1/cases/{self.legal_case.id}/'), (200, 1))
+        self.assertEqual(self.count_scope_queries(f'/api/v1/cases/{self.other_case.id}/')[0], 403)
+        client_id = self.legal_case.client_id
+        self.assertEqual(self.count_scope_queries(f'/api/v1/clients/{client_id}/')[0], 200)
+        self.assertEqual(self.count_scope_queries(f'/api/v1/case-offices/{self.case_office.id}/'), (200, 0))
+
+    def test_log_list_requires_legal_case_parent(self):
+        response = self.api.get(
+            '/api/v1/logs/', {'parent_type': 'Client', 'parent_id': 1}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class TokenCacheTestCase(TestCase):
+    def setUp(self):
+        token_cache.cache.clear()
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user.auth_token.key}')
+
+    def count_token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/v1/case-types/')
+        token_queries = [q for q in queries if 'authtoken_token' in q['sql']]
+        return response.status_code, len(token_queries)
+
+    def test_warm_cache_skips_queries(self):
+        stats = token_cache.stats()
+        self.assertEqual(self.count_token_queries(), (200, 1))
+        self.assertEqual(self.count_token_queries(), (200, 0))
+        self.assertEqual(token_cache.hits - stats['hits'], 1)
+        self.assertEqual(token_cache.misses - stats['misses'], 1)
+
+    def test_login_keeps_cache(self):
+        self.count_token_queries()
+        with CaptureQueriesContext(connection) as queries:
+            update_last_login(None, self.user)
+        self.assertFalse([q for q in queries if 'authtoken_token' in q['sql']])
+        self.assertEqual(self.count_token_queries(), (200, 0))
+
+    def test_disabled_without_shared_cache(self):
+        with override_settings(CACHES={**settings.CACHES, 'tokens': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+        }}):
+            self.assertFalse(token_cache.enabled)
+            stats = token_cache.stats()
+            self.assertEqual(self.count_token_queries(), (200, 1))
+            self.assertEqual(self.count_token_queries(), (200, 1))
+            self.assertEqual(token_cache.stats(), stats)
+            with CaptureQueriesContext(connection) as queries:
+                self.user.save()
+            self.assertFalse([q for q in queries if 'authtoken_token' in q['sql']])
+
+    def test_user_change_invalidates(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.count_token_queries(), (401, 1))
+
+    def test_token_deletion_invalidates(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.auth_token.delete()
+        self.assertEqual(self.count_token_queries(), (401, 1))
+
+
+class ImportTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office', case_office_code='T00'
+        )
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+
+    def rows(self, count, start=0):
+        return [
+            {
+                'name': f'Client {i}',
+                'official_identifier': str(start + i),
+                'official_identifier_type': 'National',
+                'case_summary': f'Case {i}',
+            }
+            for i in range(count)
+        ]
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(
+                'name,official_identifier,official_identifier_type,case_summary,case_state\n'
+                'Client 1,8001015009081,National,First case,\n'
+                ',8001015009082,National,No client name,\n'
+                'Client 3,8001015009087,National,Third case,Closed\n'
+            )
+            file.flush()
+            stderr = StringIO()
+            call_command(
+                'import_cases', file.name, case_office=self.case_office.id,
+                user=self.user.email, stdout=StringIO(), stderr=stderr,
+            )
+        self.assertIn('Row 2', stderr.getvalue())
+        legal_cases = LegalCase.objects.filter(case_offices=self.case_office).order_by('id')
+        prefix = f'T00/{timezone.localtime():%y%m}'
+        self.assertEqual(
+            [(c.case_number, c.client.name, c.summary, c.state) for c in legal_cases],
+            [
+                (f'{prefix}/0001', 'Client 1', 'First case', 'Opened'),
+                (f'{prefix}/0002', 'Client 3', 'Third case', 'Closed'),
+            ],
+        )
+        self.assertEqual(legal_cases[0].client.preferred_name, 'Client 1')
+        self.assertEqual(LegalCaseLifecycle.objects.filter(closed_at__isnull=False).count(), 1)
+        self.assertEqual(Log.objects.filter(action='Create', user=self.user).count(), 4)
+        self.assertEqual(
+            LogChange.objects.filter(
+                field='case_offices', action='Add', log__target_id=legal_cases[0].id
+            ).count(),
+            1,
+        )
+
+        metrics = dict(
+            CaseOfficeDailyMetric.objects.filter(
+                case_office=self.case_office
+            ).values_list('metric', 'value')
+        )
+        self.assertEqual(
+            metrics, {'CasesOpened': 2, 'CasesClosed': 1, 'CasesWithActivity': 2}
+        )
+        call_command('backfill_daily_metrics', stdout=StringIO())
+        rebuilt = dict(
+            CaseOfficeDailyMetric.objects.filter(
+                case_office=self.case_office
+            ).values_list('metric', 'value')
+        )
+        self.assertEqual(rebuilt, metrics)
+
+    def test_duplicate_official_identifier(self):
+        rows = [
+            {'name': f'Client {i}', 'official_identifier': '1', 'official_identifier_type': 'National'}
+            for i in range(2)
+        ]
+        result = CaseImporter(self.case_office, self.user).run(rows)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors[0]['row'], 2)
+        result = CaseImporter(self.case_office, self.user).run(rows[:1])
+        self.assertEqual(result.created, 0)
+        self.assertEqual(len(result.errors), 1)
+
+    def test_missing_official_identifier(self):
+        rows = [
+            {'name': f'Client {i}', 'official_identifier': None, 'official_identifier_type': None}
+            for i in range(2)
+        ]
+        result = CaseImporter(self.case_office, self.user).run(rows)
+        self.assertEqual((result.created, result.errors), (2, []))
+        result = CaseImporter(self.case_office, self.user).run(rows)
+        self.assertEqual((result.created, result.errors), (2, []))
+
+    def test_constant_queries(self):
+        counts = []
+        for start, count in ((0, 5), (100, 50)):
+            with CaptureQueriesContext(connection) as queries:
+                result = CaseImporter(self.case_office, self.user).run(self.rows(count, start))
+            self.assertEqual(result.created, count)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_import_api(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        upload = StringIO('\n'.join(json.dumps(row) for row in self.rows(3)))
+        upload.name = 'cases.jsonl'
+        response = api.post(
+            '/api/v1/imports', {'file': upload, 'caseOffice': self.case_office.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 3)
+        self.assertEqual(self.case_office.legalcase_set.count(), 3)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office', case_office_code='T00'
+        )
+        other_office = CaseOffice.objects.create(
+            name='Other office', description='Other office', case_office_code='T01'
+        )
+        client = ClientModel.objects.create(name='Test, "quoted" client')
+        for i, case_office in enumerate((self.case_office, self.case_office, other_office)):
+            LegalCase.objects.create(
+                case_number=f'T00/{i}', client=client, summary=f'Summary <{i}>'
+            ).case_offices.add(case_office)
+        self.user = User.objects.create_user(
+            'worker@test.test', 'password', permission_group='AdviceOfficeAdmin',
+            case_office=self.case_office,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def export(self, url, case_office=None):
+        params = {'caseOffice': case_office.id} if case_office else {}
+        response = self.api.get(url, params)
+        if response.status_code != 200:
+            return response.status_code, None
+        return response.status_code, b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        status, content = self.export('/api/v1/exports/cases.csv', self.case_office)
+        self.assertEqual(status, 200)
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['case_number'] for row in rows], ['T00/0', 'T00/1'])
+        self.assertEqual(rows[0]['summary'], 'Summary <0>')
+
+        status, content = self.export('/api/v1/exports/clients.csv', self.case_office)
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['name'] for row in rows], ['Test, "quoted" client'])
+
+    def test_xlsx_export(self):
+        status, content = self.export('/api/v1/exports/logs.xlsx', self.case_office)
+        self.assertEqual(status, 200)
+        with zipfile.ZipFile(BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        # header and the create log of both cases of the office
+        self.assertEqual(sheet.count('<row>'), 3)
+        self.assertIn('>parent_type<', sheet)
+
+    def test_export_scope(self):
+        other_office = CaseOffice.objects.get(name='Other office')
+        self.assertEqual(self.export('/api/v1/exports/cases.csv')[0], 403)
+        self.assertEqual(self.export('/api/v1/exports/cases.csv', other_office)[0], 403)
+        self.assertEqual(self.export('/api/v1/exports/users.csv', self.case_office)[0], 404)
+        response = self.api.get('/api/v1/exports/cases.csv', {'caseOffice': 'T00'})
+        self.assertEqual(response.status_code, 400)
+        self.api.force_authenticate(User.objects.create_user(
+            'reporting@test.test', 'password', permission_group='Reporting'
+        ))
+        self.assertEqual(self.export('/api/v1/exports/cases.csv', self.case_office)[0], 403)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.case_office = CaseOffice.objects.create(
+            name='Test office', description='Test office', case_office_code='T00'
+        )
+        other_office = CaseOffice.objects.create(
+            name='Other office', description='Other office', case_office_code='T01'
+        )
+        self.client_model = ClientModel.objects.create(
+            name='Thandiwe Nkosi', official_identifier='8001015009087',
+            official_identifier_type='National',
+        )
+        self.legal_case = LegalCase.objects.create(
+            case_number='T00/1', client=self.client_model,
+            summary='Eviction from a rented flat',
+        )
+        self.legal_case.case_offices.add(self.case_office)
+        Note.objects.create(
+            legal_case=self.legal_case, title='Lease', content='Landlord evicted the client'
+        )
+        Meeting.objects.create(
+            legal_case=self.legal_case, meeting_date=timezone.now(),
+            location='Office', notes='Discussed the eviction notice',
+        )
+        other_client = ClientModel.objects.create(name='Thandiwe Other')
+        LegalCase.objects.create(
+            case_number='T01/1', client=other_client, summary='Eviction'
+        ).case_offices.add(other_office)
+        self.user = User.objects.create_user(
+            'worker@test.test', 'password', permission_group='CaseWorker',
+            case_office=self.case_office,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def search(self, q):
+        response = self.api.get(
+            '/api/v1/search', {'q': q, 'caseOffice': self.case_office.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search(self):
+        data = self.search('evictions')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(
+            sorted(result['type'] for result in data['results']),
+            ['legal_case', 'meeting', 'note'],
+        )
+        self.assertTrue(all(result['legal_case'] == self.legal_case.id for result in data['results']))
+
+        results = self.search('thandiwe')['results']
+        self.assertEqual(
+            [(r['type'], r['id']) for r in results], [('client', self.client_model.id)]
+        )
+        self.assertEqual(self.search('8001015009087')['count'], 1)
+
+    def test_search_scope(self):
+        response = self.api.get('/api/v1/search', {'q': 'eviction'})
+        self.assertEqual(response.status_code, 403)
+        response = self.api.get('/api/v1/search', {'q': 'eviction', 'caseOffice': 'T00'})
+        self.assertEqual(response.status_code, 400)
+        self.api.force_authenticate(User.objects.create_user(
+            'reporting@test.test', 'password', permission_group='Reporting'
+        ))
+        response = self.api.get('/api/v1/search', {'q': 'eviction', 'caseOffice': self.case_office.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_fuzzy_names(self):
+        if not trigram_installed():
+            self.skipTest('pg_trgm is not available')
+        results = self.search('Tandiwe Nkozi')['results']
+        self.assertEqual(results[0]['id'], self.client_model.id)
+
+    def test_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = (
+            ClientModel.objects.annotate(document=CLIENT_SEARCH_VECTOR)
+            .filter(document=SearchQuery('thandiwe', config='simple'))
+            .explain()
+        )
+        self.assertIn('client_search_idx', plan)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        client = ClientModel.objects.create(name='Test client')
+        self.legal_case = LegalCase.objects.create(case_number='T00/1', client=client)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def assertNotModified(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.api.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse(cached.content)
+        self.assertFalse(
+            [q for q in queries if 'case_management_legalcase_meetings' in q['sql']
+             or 'FROM "case_management_meeting"' in q['sql']]
+        )
+        return response['ETag']
+
+    def test_retrieve(self):
+        url = f'/api/v1/cases/{self.legal_case.id}/'
+        etag = self.assertNotModified(url)
+        Meeting.objects.create(
+            legal_case=self.legal_case, meeting_date=timezone.now(),
+            location='Office', notes='Notes',
+        )
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['meetings']), 1)
+
+    def test_list(self):
+        etag = self.assertNotModified('/api/v1/cases/')
+        self.legal_case.summary = 'Updated'
+        self.legal_case.save()
+        response = self.api.get('/api/v1/cases/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        other = self.api.get('/api/v1/cases/?state=Opened', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+    def test_page(self):
+        newest = LegalCase.objects.create(case_number='T00/2', client=self.legal_case.client)
+        url = '/api/v1/cases/?page_size=1&fields=case_number'
+        etag = self.assertNotModified(url)
+        # Only rows of the page validate it
+        LegalCase.objects.filter(id=self.legal_case.id).update(updated_at=timezone.now())
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        LegalCase.objects.filter(id=newest.id).update(updated_at=timezone.now())
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{'case_number': 'T00/2'}])
+
+    def test_stream(self):
+        response = self.api.get('/api/v1/cases/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_scoped_to_resource(self):
+        url = f'/api/v1/cases/{self.legal_case.id}/'
+        etag = self.assertNotModified(url)
+        other_client = ClientModel.objects.create(name='Other client')
+        other_case = LegalCase.objects.create(case_number='T00/2', client=other_client)
+        Meeting.objects.create(
+            legal_case=other_case, meeting_date=timezone.now(), location='Office', notes='Notes',
+        )
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A client serializes its legal cases
+        url = f'/api/v1/clients/{self.legal_case.client_id}/'
+        etag = self.assertNotModified(url)
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        LegalCase.objects.get(id=self.legal_case.id).case_offices.add(
+            CaseOffice.objects.create(name='Test office', description='Test office')
+        )
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['case_offices']), 1)
+
+    @override_settings(AUDIT_LOG_ASYNC=True)
+    def test_outbox(self):
+        url = f'/api/v1/cases/{self.legal_case.id}/'
+        etag = self.assertNotModified(url)
+        Meeting.objects.create(
+            legal_case=self.legal_case, meeting_date=timezone.now(),
+            location='Office', notes='Notes',
+        )
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_case_office_list(self):
+        case_office = CaseOffice.objects.create(name='Test office', description='Test office')
+        self.legal_case.case_offices.add(case_office)
+        self.assertNotModified(f'/api/v1/cases/?caseOffice={case_office.id}')
+        self.assertNotModified(f'/api/v1/clients/?caseOffice={case_office.id}')
+
+
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        self.client_model = ClientModel.objects.create(name='Test client')
+        for i in range(3):
+            LegalCase.objects.create(
+                case_number=f'T00/{i}', client=self.client_model, summary='Summary'
+            )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/v1/cases/', {'fields': 'id,case_number'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [sorted(case) for case in response.json()], [['case_number', 'id']] * 3
+        )
+        case_queries = [
+            q['sql'] for q in queries if 'FROM "case_management_legalcase"' in q['sql']
+        ]
+        self.assertTrue(case_queries)
+        self.assertFalse([sql for sql in case_queries if '"summary"' in sql])
+        # no relation is serialized, so none is loaded
+        self.assertFalse([q for q in queries if 'case_management_meeting' in q['sql']])
+
+    def test_expand(self):
+        response = self.api.get(
+            '/api/v1/cases/', {'fields': 'id,client', 'expand': 'client'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [case['client']['name'] for case in response.json()], ['Test client'] * 3
+        )
+        response = self.api.get(f'/api/v1/cases/{LegalCase.objects.first().id}/', {'expand': 'client'})
+        self.assertEqual(response.json()['client']['id'], self.client_model.id)
+        self.assertIn('summary', response.json())
+
+    def test_expand_scope(self):
+        case_office, other_office = (
+            CaseOffice.objects.create(name=name, description=name)
+            for name in ('Test office', 'Other office')
+        )
+        legal_case, other_case, _ = LegalCase.objects.order_by('id')
+        legal_case.case_offices.add(case_office)
+        other_case.case_offices.add(other_office)
+        self.api.force_authenticate(User.objects.create_user(
+            'worker@test.test', 'password', permission_group='CaseWorker',
+            case_office=case_office,
+        ))
+        response = self.api.get(
+            f'/api/v1/clients/{self.client_model.id}/', {'expand': 'legal_cases'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [case['id'] for case in response.json()['legal_cases']], [legal_case.id]
+        )
+
+    def test_relations_prefetched(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.api.get('/api/v1/cases/').status_code, 200)
+            return len(queries)
+
+        count = count_queries()
+        LegalCase.objects.create(case_number='T00/3', client=self.client_model)
+        self.assertEqual(count_queries(), count)
+
+
+class QueryCountTestCase(TestCase):
+    """Lists take the same number of queries for 1, 10 and 1000 rows"""
+
+    urls = [
+        '/api/v1/cases/',
+        '/api/v1/cases/?expand=client,users,case_types,case_offices,meetings',
+        '/api/v1/cases/?fields=id,client,case_offices&expand=client',
+        '/api/v1/clients/',
+        '/api/v1/clients/?include=updates',
+        '/api/v1/clients/?expand=legal_cases,case_offices,users',
+        '/api/v1/case-offices/',
+        '/api/v1/case-types/',
+        '/api/v1/case-updates/',
+        '/api/v1/case-updates/?expand=legal_case,case_offices',
+        '/api/v1/meetings/',
+        '/api/v1/notes/?expand=legal_case',
+        '/api/v1/users/',
+        '/api/v1/logs/',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.rows = 0
+
+    def seed(self, count):
+        start = self.rows
+        self.rows += count
+        case_office = CaseOffice.objects.create(
+            name=f'Office {start}', description='Office', case_office_code=f'Q{start}'
+        )
+        CaseImporter(case_office, self.user).run(
+            {
+                'name': f'Client {i}',
+                'official_identifier': str(i),
+                'official_identifier_type': 'National',
+                'case_summary': f'Summary {i}',
+            }
+            for i in range(start, self.rows)
+        )
+        legal_cases = list(LegalCase.objects.filter(case_offices=case_office))
+        users = User.objects.bulk_create(
+            [User(email=f'user{i}@test.test', case_office=case_office) for i in range(start, self.rows)]
+        )
+        case_types = CaseType.objects.bulk_create(
+            [CaseType(title=f'Type {i}', description='Type') for i in range(start, self.rows)]
+        )
+        LegalCase.users.through.objects.bulk_create(
+            [
+                LegalCase.users.through(legalcase_id=legal_case.id, user_id=user.id)
+                for legal_case, user in zip(legal_cases, users)
+            ]
+        )
+        ClientModel.users.through.objects.bulk_create(
+            [
+                ClientModel.users.through(client_id=legal_case.client_id, user_id=user.id)
+                for legal_case, user in zip(legal_cases, users)
+            ]
+        )
+        LegalCase.case_types.through.objects.bulk_create(
+            [
+                LegalCase.case_types.through(legalcase_id=legal_case.id, casetype_id=case_type.id)
+                for legal_case, case_type in zip(legal_cases, case_types)
+            ]
+        )
+        case_updates = CaseUpdate.objects.bulk_create(
+            [CaseUpdate(legal_case=legal_case) for legal_case in legal_cases]
+        )
+        Note.objects.bulk_create(
+            [
+                Note(legal_case=case_update.legal_case, case_update=case_update, title='Note', content='Note')
+                for case_update in case_updates
+            ]
+        )
+        Meeting.objects.bulk_create(
+            [
+                Meeting(legal_case=legal_case, meeting_date=timezone.now(), location='Office', notes='Notes')
+                for legal_case in legal_cases
+            ]
+        )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertTrue(json.loads(content), url)
+        return len(queries)
+
+    def test_constant_queries(self):
+        counts = {}
+        for count in (1, 9, 990):
+            self.seed(count)
+            for url in self.urls:
+                counts.setdefault(url, []).append(self.count_queries(url))
+        for url, url_counts in counts.items():
+            self.assertEqual(len(set(url_counts)), 1, f'{url}: {url_counts}')
+
+
+class SyntheticDataTestCase(TestCase):
+    def generate(self, seed):
+        call_command(
+            'generate_synthetic_data', '--clients', '20', '--seed', str(seed),
+            '--end-date', '2022-09-30', stdout=StringIO(),
+        )
+        return list(
+            LegalCase.objects.order_by('id').values_list(
+                'case_number', 'state', 'client__name', 'created_at'
+            )
+        )
+
+    def test_deterministic(self):
+        with transaction.atomic():
+            cases = self.generate(1)
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            self.assertEqual(self.generate(1), cases)
+            transaction.set_rollback(True)
+        self.assertNotEqual(self.generate(2), cases)
+
+    def test_consistent(self):
+        self.generate(1)
+        self.assertEqual(LegalCase.objects.count(), 20)
+        self.assertFalse(LegalCase.objects.filter(case_offices=None).exists())
+        self.assertEqual(LegalCaseLifecycle.objects.count(), 20)
+        self.assertEqual(
+            Log.objects.filter(target_type='LegalCase', action='Create').count(), 20
+        )
+        self.assertEqual(
+            CaseOfficeDailyMetric.objects.filter(metric='CasesOpened').aggregate(
+                total=Sum('value')
+            )['total'],
+            20,
+        )
+        # New primary keys and case numbers follow the generated ones
+        legal_case = LegalCase.objects.order_by('id').last()
+        prefix = legal_case.case_number.rsplit('/', 1)[0]
+        self.assertTrue(CaseNumberSequence.objects.filter(prefix=prefix).exists())
+        new_case = LegalCase.objects.create(
+            case_number='T00/0001', client=legal_case.client
+        )
+        self.assertGreater(new_case.id, legal_case.id)
+
+
+class RequestInstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        client = ClientModel.objects.create(name='Test client')
+        LegalCase.objects.create(case_number='T00/1', client=client)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_off_by_default(self):
+        response = self.api.get('/api/v1/cases/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with self.assertLogs('case_management.instrumentation') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.get('/api/v1/cases/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+        [line] = logs.records
+        record = json.loads(line.getMessage())
+        self.assertEqual(record['view'], 'legalcase-list')
+        self.assertEqual(record['queries'], len(queries))
+        self.assertEqual(record['response_bytes'], len(response.content))
+        self.assertIn('SELECT', record['slowest_sql'])
+        self.assertGreater(record['serializer_ms'], 0)
+
+    @override_settings(REQUEST_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_streamed_response(self):
+        with self.assertLogs('case_management.instrumentation') as logs:
+            response = self.api.get('/api/v1/cases/', {'stream': 1})
+            content = b''.join(response.streaming_content)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['response_bytes'], len(content))
+        self.assertGreater(record['queries'], 0)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'admin@test.test', 'password', permission_group='Admin'
+        )
+        client = ClientModel.objects.create(name='Test client')
+        LegalCase.objects.create(case_number='T00/1', client=client)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        report_cache.cache.clear()
+
+    def test_off_by_default(self):
+        self.assertEqual(self.api.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics(self):
+        requests = metrics.api_requests.get(view='LegalCaseViewSet', action='list', status=200)
+        listed = metrics.api_request_duration.count(view='LegalCaseViewSet', action='list')
+        reports = metrics.report_query_duration.count(report='range_summary')
+        self.api.get('/api/v1/cases/')
+        self.api.get('/api/v1/reports/range-summary')
+        self.assertEqual(
+            metrics.api_requests.get(view='LegalCaseViewSet', action='list', status=200),
+            requests + 1,
+        )
+        self.assertEqual(
+            metrics.api_request_duration.count(view='LegalCaseViewSet', action='list'),
+            listed + 1,
+        )
+        self.assertEqual(metrics.report_query_duration.count(report='range_summary'), reports + 1)
+
+        response = self.api.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE case_management_api_request_duration_seconds histogram', text)
+        self.assertIn(
+            'case_management_api_request_duration_seconds_bucket'
+            '{view="LegalCaseViewSet",action="list",le="+Inf"}',
+            text,
+        )
+        self.assertIn('case_management_api_requests_total{view="range-summary",action="get",status="200"}', text)
+        self.assertIn('case_management_db_connection_requests_total{connection="reused"}', text)
+        self.assertRegex(text, r'case_management_process_resident_memory_bytes [1-9]')
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.api.get('/metrics').status_code, 401)
+        response = self.api.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
 def assertValidHTML(string):
     """
     Raises exception if the string is not valid HTML, e.g. has unmatched tags
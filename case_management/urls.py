@@ -28,6 +28,11 @@ from case_management.views import (
     range_summary,
     monthly_summary,
     daily_summary,
+    cache_stats,
+    metrics_view,
+    import_cases,
+    export,
+    search,
 )
 
 # Note: For Sentry integration testing
@@ -75,6 +80,11 @@ urlpatterns = [
     path('api/v1/reports/monthly-summary',
          monthly_summary, name='monthly-summary'),
     path('api/v1/reports/daily-summary', daily_summary, name='daily-summary'),
+    path('api/v1/cache-stats', cache_stats, name='cache-stats'),
+    path('api/v1/imports', import_cases, name='import-cases'),
+    path('api/v1/exports/<str:name>.<str:export_format>', export, name='export'),
+    path('api/v1/search', search, name='search'),
+    path('metrics', metrics_view, name='metrics'),
     path(
         'api/ui/',
         schema_view.with_ui('swagger', cache_timeout=0),
@@ -1,24 +1,34 @@
+import hashlib
 import re
+import time
 from datetime import date, timedelta
+from itertools import islice
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, mixins
+from rest_framework import mixins, serializers, viewsets
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 
-from django.core.exceptions import BadRequest, FieldError
+from django.core.exceptions import BadRequest, FieldDoesNotExist, FieldError
 
+from django.conf import settings
 from django.views import generic
 
-from django.db import connection
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
 
 from django.contrib.auth.models import AnonymousUser
 
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
 
 from case_management.auth import (
     InAdminGroup,
@@ -27,7 +37,8 @@ from case_management.auth import (
     InCaseWorkerGroup,
     check_create_update_permission,
     check_scoped_list_permission,
-    check_scoped_reporting_permision
+    check_scoped_reporting_permision,
+    get_case_office_scope,
 )
 
 from case_management.serializers import (
@@ -44,20 +55,26 @@ from case_management.serializers import (
     LogSerializer,
 )
 from case_management.models import (
+    CaseNumberSequence,
     CaseOffice,
     CaseType,
     Client,
     LegalCase,
     CaseUpdate,
     File,
+    LoggedChildModel,
     Meeting,
     Note,
     User,
     Log,
+    LogOutbox,
 )
-from case_management import queries
-
-import time
+from case_management import metrics, queries
+from case_management.exports import EXPORT_FORMATS, EXPORTS, export_rows, stream_export
+from case_management.imports import CaseImporter, read_uploaded_rows
+from case_management.pagination import SearchPagination
+from case_management.search import search as search_records
+from case_management.cache import report_cache, token_cache
 
 
 def get_user(request):
@@ -66,12 +83,327 @@ def get_user(request):
     return request.user
 
 
-class LoggedModelViewSet(viewsets.ModelViewSet):
+class StreamingListMixin:
+    """
+    Lists requested with `?stream=1` are streamed as a JSON array. Rows are
+    read through a server-side cursor and serialized a chunk at a time, so
+    memory use does not grow with the size of the list.
+    """
+    stream_chunk_size = 500
+
+    def is_streamed(self, request):
+        return request.query_params.get('stream') in ('1', 'true')
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_streamed(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self._stream_list(queryset), content_type='application/json'
+        )
+
+    def _stream_list(self, queryset):
+        # iterator() ignores prefetch_related, prefetch for each chunk instead
+        prefetch_lookups = queryset._prefetch_related_lookups
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        renderer = JSONRenderer()
+        separator = b'['
+        while True:
+            chunk = list(islice(rows, self.stream_chunk_size))
+            if not chunk:
+                break
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            for item in self.get_serializer(chunk, many=True).data:
+                yield separator + renderer.render(item)
+                separator = b','
+        yield b'[]' if separator == b'[' else b']'
+
+
+class SparseFieldsetViewMixin:
+    """
+    `?fields=a,b` limits the serialized fields and `?expand=c` nests related
+    objects, see SparseFieldsetMixin.
+    """
+
+    def _query_param_set(self, name):
+        if self.request.method != 'GET' or name not in self.request.query_params:
+            return None
+        return {
+            value.strip()
+            for value in self.request.query_params[name].split(',')
+            if value.strip()
+        }
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields = self._query_param_set('fields')
+        if fields is not None:
+            context['fields'] = fields
+        context['expand'] = self._query_param_set('expand') or set()
+        return context
+
+
+def _log_parent_type(model):
+    return 'LegalCase' if issubclass(model, LoggedChildModel) else model.__name__
+
+
+def _is_single_valued(model, lookup):
+    for name in lookup.split(LOOKUP_SEP):
+        field = model._meta.get_field(name)
+        if field.many_to_many or field.one_to_many:
+            return False
+        model = field.related_model
+    return True
+
+
+class QueryPlanMixin:
+    """
+    Loads what the serializer reads up front, so that lists take the same
+    number of queries however many rows they have, and only loads the
+    columns requested with `?fields=`.
+
+    Relation fields of the models are planned from the serializer fields
+    that are output: many-relations are prefetched, with only their primary
+    keys unless they are nested serializers, and nested single relations are
+    select_related, recursively for nested serializers.
+
+    `serializer_relations` declares what else serializer fields read, e.g.
+    properties following relations. It maps field paths, `field` or
+    `nested.field` for fields of nested serializers, to lookups from the
+    viewset's model.
+    """
+    serializer_relations = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        select, prefetch = [], []
+        if self.action == 'list':
+            # Loading the relations of a single row up front saves nothing
+            serializer = self.get_serializer()
+            declared = set(self._declared_lookups(serializer, ''))
+            self._plan_relations(serializer, queryset.model, '', False, select, prefetch)
+            # Declared lookups load whole objects, the serializer may read more
+            # than the primary keys of the automatic prefetches
+            prefetch = [
+                lookup for lookup in prefetch
+                if isinstance(lookup, str) or lookup.prefetch_to not in declared
+            ]
+            for lookup in declared:
+                if _is_single_valued(queryset.model, lookup):
+                    select.append(lookup)
+                else:
+                    prefetch.append(lookup)
+        fields = self.get_serializer_context().get('fields')
+        if fields is not None:
+            lookups = select + [
+                lookup if isinstance(lookup, str) else lookup.prefetch_through
+                for lookup in prefetch
+            ]
+            fields = set(fields) | {lookup.split(LOOKUP_SEP)[0] for lookup in lookups}
+            queryset = queryset.only(
+                queryset.model._meta.pk.name,
+                *[
+                    f.name
+                    for f in queryset.model._meta.concrete_fields
+                    if f.name in fields
+                ],
+            )
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            # Prefetches with a queryset must come before plain lookups through them
+            prefetch.sort(key=lambda lookup: isinstance(lookup, str))
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def _plan_relations(self, serializer, model, prefix, through_many, select, prefetch):
+        for name, serializer_field in serializer.fields.items():
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if not field.is_relation:
+                continue
+            nested = getattr(serializer_field, 'child', serializer_field)
+            many = field.many_to_many or field.one_to_many
+            lookup = prefix + name
+            if not isinstance(nested, serializers.BaseSerializer):
+                if many:
+                    # Only the primary keys are serialized
+                    related_fields = [field.related_model._meta.pk.name]
+                    if field.one_to_many:
+                        related_fields.append(field.field.name)
+                    prefetch.append(
+                        Prefetch(
+                            lookup,
+                            queryset=field.related_model.objects.only(*related_fields),
+                        )
+                    )
+                continue
+            if many or through_many:
+                prefetch.append(lookup)
+            else:
+                select.append(lookup)
+            self._plan_relations(
+                nested,
+                field.related_model,
+                lookup + LOOKUP_SEP,
+                through_many or many,
+                select,
+                prefetch,
+            )
+
+    def _declared_lookups(self, serializer, path):
+        for name, serializer_field in serializer.fields.items():
+            yield from self.serializer_relations.get(path + name, ())
+            nested = getattr(serializer_field, 'child', serializer_field)
+            if isinstance(nested, serializers.BaseSerializer):
+                yield from self._declared_lookups(nested, f'{path}{name}.')
+
+
+class ConditionalGetMixin:
+    """
+    Sends ETag and Last-Modified with lists and single rows, and answers
+    requests whose If-None-Match or If-Modified-Since still match with 304 Not
+    Modified without serializing anything.
+
+    Lists are validated with the ids and `updated_at` of the rows of the page
+    they return, single rows with their `updated_at`. Both also include the
+    newest audit log of their model, single rows only of themselves, as
+    deletions and changes to serialized relations such as a case's meetings
+    and case offices write one but leave `updated_at` as it was.
+
+    Logs are looked up by parent type, one index probe each, and child rows
+    log with their legal case as parent. `related_log_types` lists those of
+    other rows the rows serialize, e.g. the legal cases of clients, relations
+    nested with `?expand=` add theirs. Streamed lists aren't validated.
+    """
+
+    related_log_types = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields, deferred = queryset.query.deferred_loading
+        if fields and not deferred:
+            # Rows are validated with their updated_at whatever ?fields= asks for
+            queryset = queryset.only(*fields, 'updated_at')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if self.is_streamed(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Relations are only loaded when the page is sent
+        prefetch_lookups = queryset._prefetch_related_lookups
+        queryset = queryset.prefetch_related(None)
+        rows = self.paginate_queryset(queryset)
+        paginated = rows is not None
+        if not paginated:
+            rows = list(queryset)
+        state = [(row.id, row.updated_at) for row in rows]
+        if paginated:
+            state += [self.paginator.has_next, self.paginator.has_previous]
+
+        def get_response():
+            if prefetch_lookups:
+                prefetch_related_objects(rows, *prefetch_lookups)
+            data = self.get_serializer(rows, many=True).data
+            return self.get_paginated_response(data) if paginated else Response(data)
+
+        log_types = {_log_parent_type(queryset.model), *self._related_log_types()}
+        return self._conditional_response(
+            request,
+            state,
+            [row.updated_at for row in rows],
+            [Q(parent_type=log_type) for log_type in log_types],
+            get_response,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        log_type = type(instance).__name__
+        return self._conditional_response(
+            request,
+            [instance.id, instance.updated_at],
+            [instance.updated_at],
+            [
+                Q(parent_type=log_type, parent_id=instance.id),
+                Q(target_type=log_type, target_id=instance.id),
+                *[Q(parent_type=related) for related in self._related_log_types()],
+            ],
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
+    def _related_log_types(self):
+        log_types = set(self.related_log_types)
+        expand = self.get_serializer_context().get('expand')
+        if not expand:
+            # Building the serializer isn't free, e.g. the country choices of clients
+            return log_types
+        serializer = self.get_serializer()
+        for name in expand:
+            field = serializer.fields.get(name)
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, serializers.ModelSerializer):
+                log_types.add(_log_parent_type(nested.Meta.model))
+        return log_types
+
+    def _latest_logs(self, lookups):
+        """
+        Id and time of the newest audit log of the lookups, and of the newest
+        outbox record
+        """
+        # The newest log of every lookup on its own, as together they'd be
+        # found by scanning the primary key index backwards
+        newest = [
+            Log.objects.filter(lookup).order_by('-id').values_list('id', 'created_at')[:1]
+            for lookup in lookups
+        ]
+        latest = [max(newest[0].union(*newest[1:]), default=None)]
+        if settings.AUDIT_LOG_ASYNC:
+            # Expanded into logs within seconds, so any pending record counts
+            latest.append(
+                LogOutbox.objects.order_by('-id').values_list('id', 'created_at').first()
+            )
+        return [log or (0, None) for log in latest]
+
+    def _conditional_response(self, request, state, updated_at, log_lookups, get_response):
+        latest_logs = self._latest_logs(log_lookups)
+        modified = updated_at + [created_at for _, created_at in latest_logs]
+        last_modified = max((m for m in modified if m is not None), default=None)
+        etag = quote_etag(
+            hashlib.md5(
+                repr(
+                    [request.get_full_path(), request.user.pk, state, latest_logs]
+                ).encode()
+            ).hexdigest()
+        )
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class LoggedModelViewSet(
+    ConditionalGetMixin,
+    QueryPlanMixin,
+    SparseFieldsetViewMixin,
+    StreamingListMixin,
+    viewsets.ModelViewSet,
+):
     permission_scope_query_param = 'caseOffice'
 
-    @property
-    def permission_scope_query_param_values(self):
-        return [self.request.user.case_office.id]
+    def permission_scope_includes(self, value):
+        return get_case_office_scope(self.request).includes_case_office(value)
 
     def get_permissions(self):
         permission_classes = [InAdminGroup |
@@ -93,6 +425,8 @@ class LoggedModelViewSet(viewsets.ModelViewSet):
 
 
 class UpdateRetrieveViewSet(
+    QueryPlanMixin,
+    SparseFieldsetViewMixin,
     mixins.ListModelMixin,
     mixins.UpdateModelMixin,
     mixins.RetrieveModelMixin,
@@ -108,6 +442,8 @@ class UpdateRetrieveViewSet(
 
 
 class ListViewSet(
+    QueryPlanMixin,
+    SparseFieldsetViewMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet
 ):
@@ -116,9 +452,8 @@ class ListViewSet(
     """
     permission_scope_query_param = 'caseOffice'
 
-    @property
-    def permission_scope_query_param_values(self):
-        return [self.request.user.case_office.id]
+    def permission_scope_includes(self, value):
+        return get_case_office_scope(self.request).includes_case_office(value)
 
     def get_permissions(self):
         permission_classes = [InAdminGroup | InReportingGroup |
@@ -159,8 +494,20 @@ class CaseTypeViewSet(LoggedModelViewSet):
 
 
 class ClientViewSet(LoggedModelViewSet):
+    """
+    Lists leave out the audit history of clients unless `?include=updates`
+    """
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    serializer_relations = {'case_offices': ['legal_cases__case_offices']}
+    related_log_types = ('LegalCase',)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            include = self.request.query_params.get('include', '')
+            context['include_updates'] = 'updates' in include.split(',')
+        return context
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -180,21 +527,21 @@ class ClientViewSet(LoggedModelViewSet):
 class LegalCaseViewSet(LoggedModelViewSet):
     queryset = LegalCase.objects.all()
     serializer_class = LegalCaseSerializer
+    serializer_relations = {
+        'client.case_offices': ['client__legal_cases__case_offices'],
+    }
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['client']
 
     def perform_create(self, serializer):
-        try:
-            next_id = LegalCase.objects.latest('id').id + 1
-        except LegalCase.DoesNotExist:
-            next_id = 1
-        case_office = CaseOffice.objects.get(
-            pk=self.request.data['case_offices'][0])
-        case_office_code = case_office.case_office_code
-        generated_case_number = (
-            f'{case_office_code}/{time.strftime("%y%m")}/{str(next_id).zfill(4)}'
+        case_offices = serializer.validated_data.get('case_offices')
+        if not case_offices:
+            raise ValidationError({'case_offices': 'A new case needs a case office'})
+        case_office = case_offices[0]
+        [case_number] = CaseNumberSequence.objects.next_case_numbers(
+            case_office.case_office_code
         )
-        serializer.validated_data['case_number'] = generated_case_number
+        serializer.validated_data['case_number'] = case_number
         super().perform_create(serializer)
 
     def get_queryset(self):
@@ -210,6 +557,12 @@ class LegalCaseViewSet(LoggedModelViewSet):
 class CaseUpdateViewSet(LoggedModelViewSet):
     queryset = CaseUpdate.objects.all()
     serializer_class = CaseUpdateSerializer
+    serializer_relations = {
+        'case_offices': ['legal_case__case_offices'],
+        'note.case_offices': ['note__legal_case__case_offices'],
+        'meeting.case_offices': ['meeting__legal_case__case_offices'],
+    }
+    related_log_types = ('LegalCase',)
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['legal_case']
 
@@ -218,6 +571,8 @@ class FileViewSet(LoggedModelViewSet):
     parser_classes = (MultiPartParser, FormParser)
     queryset = File.objects.all()
     serializer_class = FileSerializer
+    serializer_relations = {'case_offices': ['legal_case__case_offices']}
+    related_log_types = ('LegalCase',)
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['legal_case']
 
@@ -225,6 +580,8 @@ class FileViewSet(LoggedModelViewSet):
 class MeetingViewSet(LoggedModelViewSet):
     queryset = Meeting.objects.all()
     serializer_class = MeetingSerializer
+    serializer_relations = {'case_offices': ['legal_case__case_offices']}
+    related_log_types = ('LegalCase',)
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['legal_case']
 
@@ -232,6 +589,8 @@ class MeetingViewSet(LoggedModelViewSet):
 class NoteViewSet(LoggedModelViewSet):
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
+    serializer_relations = {'case_offices': ['legal_case__case_offices']}
+    related_log_types = ('LegalCase',)
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['legal_case']
 
@@ -246,26 +605,27 @@ class UserViewSet(UpdateRetrieveViewSet):
     serializer_class = UserSerializer
 
 
-class LogViewSet(viewsets.ReadOnlyModelViewSet):
+class LogViewSet(
+    QueryPlanMixin,
+    SparseFieldsetViewMixin,
+    StreamingListMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     permission_classes = [InAdminGroup |
                           InAdviceOfficeAdminGroup | InCaseWorkerGroup]
     queryset = Log.objects.all().order_by('-id')
     serializer_class = LogSerializer
+    serializer_relations = {'extra': ['user']}
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['parent_id', 'parent_type', 'target_id', 'target_type']
 
     permission_scope_query_param = 'parent_id'
 
-    @property
-    def permission_scope_query_param_values(self):
+    def permission_scope_includes(self, value):
         parent_type = self.request.query_params.get('parent_type')
         if parent_type != 'LegalCase':
             raise ValidationError('Must provide parent_type=LegalCase')
-        parent_id = self.request.query_params.get('parent_id')
-        user_case_office = self.request.user.case_office.id
-        legalcase_case_offices = LegalCase.objects.filter(
-            case_offices__id=user_case_office).values_list('id', flat=True)
-        return legalcase_case_offices
+        return get_case_office_scope(self.request).includes_legal_case(value)
 
     def get_permissions(self):
         if self.action == 'list':
@@ -332,20 +692,39 @@ def _get_summary_date_range(request):
     return start_date, end_date
 
 
+def _get_report_case_office(request):
+    case_office = request.query_params.get('caseOffice')
+    if case_office is None:
+        return None
+    try:
+        return int(case_office)
+    except ValueError:
+        raise ValidationError({'caseOffice': 'Must be a case office id'})
+
+
+def _run_report(name, query):
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        data = queries.run(cursor, query)
+    if settings.METRICS_ENABLED:
+        metrics.report_query_duration.observe(time.perf_counter() - started, report=name)
+    return data
+
+
 @api_view(['GET'])
 @permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
 def range_summary(request):
+    case_office = _get_report_case_office(request)
     check_scoped_reporting_permision(request)
     start_date, end_date = _get_summary_date_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.range_summary(
-            start_date, end_date, case_office))
-        row = cursor.fetchone()
+    data = report_cache.get_or_compute(
+        'range_summary', start_date, end_date, case_office,
+        lambda: _run_report('range_summary', queries.range_summary(start_date, end_date, case_office))
+    )
     response = {
         'startDate': start_date,
         'endDate': end_date,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
 
@@ -353,17 +732,17 @@ def range_summary(request):
 @api_view(['GET'])
 @permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
 def daily_summary(request):
+    case_office = _get_report_case_office(request)
     check_scoped_reporting_permision(request)
     start_month, end_month = _get_summary_months_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.daily_summary(
-            start_month, end_month, case_office))
-        row = cursor.fetchone()
+    data = report_cache.get_or_compute(
+        'daily_summary', start_month, end_month, case_office,
+        lambda: _run_report('daily_summary', queries.daily_summary(start_month, end_month, case_office))
+    )
     response = {
         'startMonth': start_month,
         'endMonth': end_month,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
 
@@ -371,16 +750,113 @@ def daily_summary(request):
 @api_view(['GET'])
 @permission_classes([InAdminGroup | InReportingGroup | InAdviceOfficeAdminGroup])
 def monthly_summary(request):
+    case_office = _get_report_case_office(request)
     check_scoped_reporting_permision(request)
     start_month, end_month = _get_summary_months_range(request)
-    case_office = request.query_params.get('caseOffice')
-    with connection.cursor() as cursor:
-        cursor.execute(queries.monthly_summary(
-            start_month, end_month, case_office))
-        row = cursor.fetchone()
+    data = report_cache.get_or_compute(
+        'monthly_summary', start_month, end_month, case_office,
+        lambda: _run_report('monthly_summary', queries.monthly_summary(start_month, end_month, case_office))
+    )
     response = {
         'startMonth': start_month,
         'endMonth': end_month,
-        'dataPerCaseOffice': row[0]
+        'dataPerCaseOffice': data
     }
     return Response(response)
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup | InAdviceOfficeAdminGroup | InCaseWorkerGroup])
+def export(request, name, export_format):
+    """
+    Stream all cases, clients or audit logs, of the case office `caseOffice`
+    if given, as CSV or XLSX. Scoped users must filter by their case office.
+    """
+    if name not in EXPORTS or export_format not in EXPORT_FORMATS:
+        raise NotFound
+    case_office = _get_report_case_office(request)
+    check_scoped_reporting_permision(request)
+    columns, rows = export_rows(name, case_office)
+    response = StreamingHttpResponse(
+        stream_export(columns, rows, export_format, sheet_name=name),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup | InAdviceOfficeAdminGroup | InCaseWorkerGroup])
+def search(request):
+    """
+    Clients, legal cases, notes and meetings matching `q`, ranked and paged
+    with `limit` and `offset`. Scoped users must filter by their case office
+    with `caseOffice`.
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        raise ValidationError({'q': 'Provide a search text'})
+    case_office = _get_report_case_office(request)
+    check_scoped_reporting_permision(request)
+    results = search_records(text, case_office)
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(results, request)
+    return paginator.get_paginated_response(
+        [
+            {
+                'type': result_type,
+                'id': result_id,
+                'label': label,
+                'legal_case': legal_case,
+                'rank': rank,
+            }
+            for result_type, result_id, label, legal_case, rank in page
+        ]
+    )
+
+
+@api_view(['GET'])
+@permission_classes([InAdminGroup])
+def cache_stats(request):
+    return Response({'reports': report_cache.stats(), 'tokens': token_cache.stats()})
+
+
+def metrics_view(request):
+    """
+    Metrics of this worker in the Prometheus text format, when
+    METRICS_ENABLED is set.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(
+        metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@transaction.non_atomic_requests
+@api_view(['POST'])
+@permission_classes([InAdminGroup])
+@parser_classes([MultiPartParser])
+def import_cases(request):
+    """
+    Import clients with a legal case each from an uploaded CSV or JSONL
+    `file` into the case office `caseOffice`, see `manage.py import_cases`.
+    Outside of ATOMIC_REQUESTS, so imported chunks are committed as they go.
+    """
+    if 'file' not in request.FILES:
+        raise ValidationError({'file': 'Upload a CSV or JSONL file'})
+    try:
+        case_office = CaseOffice.objects.get(id=request.data.get('caseOffice'))
+    except (CaseOffice.DoesNotExist, ValueError):
+        raise ValidationError({'caseOffice': 'Unknown case office'})
+    try:
+        rows = read_uploaded_rows(request.FILES['file'], request.data.get('format'))
+        result = CaseImporter(case_office, get_user(request)).run(rows)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValidationError({'file': str(e)})
+    return Response(result.as_dict())